@@ -0,0 +1,69 @@
+#
+#  file: bank.py
+#
+#  Generate a bank of problems for one op ahead of time, for
+#  worksheets.py --bank to draw pages from.  Python 3.
+#
+#    python3 bank.py add2 1000000 add2.bank
+#    python3 worksheets.py add2 10 add2 --bank add2.bank
+#
+#  Public domain
+#
+################################################################
+
+import sys
+import time
+import argparse
+
+import worksheets
+
+
+################################################################
+#  Generate
+#
+def Generate(op, count, seed=1, batched=False):
+    """A Pool of count problems for op"""
+
+    kind = worksheets.PROBLEMS[op]
+    pages = -(-count // (4*kind.rows))
+    ws = worksheets.Worksheets(op, pages, "", seed=seed, batched=batched)
+    pool = worksheets.Pool(kind)
+    pool.seed = seed
+    for values in ws.Values():
+        for v in values[:count - len(pool)]:
+            pool.Append(v)
+    return pool
+
+
+################################################################
+#  main
+#
+def main():
+    """Parse command line"""
+
+    parser = argparse.ArgumentParser(prog="bank",
+                description="Precompute a problem bank for worksheets.py --bank")
+    parser.add_argument("op", choices=list(worksheets.PROBLEMS))
+    parser.add_argument("count", type=int, help="problems in the bank")
+    parser.add_argument("output")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batched", action="store_true",
+                        help="generate with the vectorized operand paths")
+    args = parser.parse_args()
+
+    if (args.count < 1):
+        parser.error("count must be at least 1")
+    start = time.perf_counter()
+    try:
+        pool = Generate(args.op, args.count, args.seed, args.batched)
+    except TypeError as e:
+        print("%s problems cannot be banked: %s" % (args.op, e), file=sys.stderr)
+        sys.exit(1)
+    with open(args.output, "wb") as f:
+        pool.Save(f)
+    print("%d %s problems, %d bytes, %0.2f s" % (len(pool), args.op,
+          worksheets.Pool.SIZE + 8*pool.width*len(pool), time.perf_counter() - start))
+
+
+if (__name__ == "__main__"):
+    main()
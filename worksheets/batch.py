@@ -0,0 +1,192 @@
+#
+#  file: batch.py
+#
+#  Build many worksheets from a manifest in one process.  Python 3.
+#
+#  Public domain
+#
+################################################################
+
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import worksheets
+
+
+################################################################
+#  Target
+#
+class Target:
+    """One line of a manifest"""
+
+    def __init__(self, op, pages, output, seed=None, line=0):
+        """Constructor"""
+
+        self.op = op
+        self.pages = pages
+        self.output = output
+        self.seed = seed
+        self.line = line
+
+    def __repr__(self):
+        return "Target(%r, %d, %r)" % (self.op, self.pages, self.output)
+
+
+################################################################
+#  ReadManifest
+#
+def ReadManifest(fname):
+    """Parse a manifest, outputs are relative to the manifest itself"""
+
+    base = os.path.dirname(os.path.abspath(fname))
+    targets = []
+    with open(fname) as f:
+        for n, line in enumerate(f, 1):
+            line = line.split("#")[0].strip()
+            if (line == ""):
+                continue
+            t = line.split()
+            if (len(t) not in [3,4]):
+                raise ValueError("%s:%d: expected <op> <pages> <output> [<seed>]" % (fname, n))
+            if (t[0] not in worksheets.PROBLEMS):
+                raise ValueError("%s:%d: unknown op %s" % (fname, n, t[0]))
+            seed = int(t[3]) if (len(t) == 4) else None
+            targets.append(Target(t[0], int(t[1]), os.path.join(base, t[2]), seed, n))
+    return targets
+
+
+################################################################
+#  Plan
+#
+def Plan(targets, out=sys.stdout):
+    """List what would be built"""
+
+    total = 0
+    for t in targets:
+        kind = worksheets.PROBLEMS[t.op]
+        n = 4*kind.rows*t.pages
+        total += n
+        print("%-6s %3d pages %5d problems  %s" % (t.op, t.pages, n,
+              os.path.relpath(t.output)), file=out)
+    print("%d targets, %d problems" % (len(targets), total), file=out)
+
+
+################################################################
+#  Build
+#
+def Build(target, timeout=worksheets.COMPILE_TIMEOUT, fmt=False, cache=None,
+          single=False):
+    """Build one target, runs in a worker process"""
+
+    start = time.perf_counter()
+    if (cache is not None):
+        cache = worksheets.PdfCache(cache)
+    results = worksheets.Worksheets(target.op, target.pages,
+                                    target.output, timeout, fmt, cache,
+                                    seed=target.seed, single=single).Create()
+    return target, results, time.perf_counter() - start
+
+
+################################################################
+#  Run
+#
+def Run(targets, jobs=None, timeout=worksheets.COMPILE_TIMEOUT, fmt=False,
+        cache=None, single=False, out=sys.stdout):
+    """Build all targets across a process pool, report as they finish.
+
+    cache is the PDF cache size limit in bytes, or None for no cache.
+    """
+
+    for t in targets:
+        os.makedirs(os.path.dirname(t.output), exist_ok=True)
+
+    start = time.perf_counter()
+    if (fmt):
+        #  dump the shared preamble once, before the workers need it
+        worksheets.PreambleFormat(timeout, out=out)
+
+    failed = []
+    hits = docs = 0
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = {pool.submit(Build, t, timeout, fmt, cache, single): t for t in targets}
+        for fut in as_completed(futures):
+            try:
+                target, results, elapsed = fut.result()
+            except Exception as e:
+                #  one broken target does not stop the rest
+                target = futures[fut]
+                print("%-6s %-30s  FAIL %s" % (target.op, type(e).__name__,
+                      os.path.relpath(target.output)), file=out)
+                failed.append((target, [worksheets.CompileResult(target.output, None, 0,
+                               "%s: %s" % (type(e).__name__, e))]))
+                continue
+            tex = max(r.elapsed for r in results)
+            ok = all(r.ok for r in results)
+            state = "ok" if ok else "FAIL"
+            if (all(r.cached for r in results)):
+                state = "hit"
+            hits += sum(r.cached for r in results)
+            docs += len(results)
+            print("%-6s %7.2f s  (pdflatex %6.2f s)  %-4s %s" % (target.op,
+                  elapsed, tex, state, os.path.relpath(target.output)), file=out)
+            if (not ok):
+                failed.append((target, results))
+
+    print("%d targets, %d failed, %0.2f s total" % (len(targets), len(failed),
+          time.perf_counter() - start), file=out)
+    if (cache is not None):
+        st = worksheets.PdfCache(cache).Stats()
+        print("%d of %d documents from the cache, %d entries, %0.1f MB" % (hits,
+              docs, st["entries"], st["bytes"]/2**20), file=out)
+    return failed
+
+
+################################################################
+#  main
+#
+def main():
+    """Parse command line"""
+
+    parser = argparse.ArgumentParser(prog="batch",
+                description="Build every worksheet listed in a manifest")
+    parser.add_argument("manifest")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--timeout", type=float, default=worksheets.COMPILE_TIMEOUT,
+                        help="seconds allowed per pdflatex run")
+    parser.add_argument("--fmt", action="store_true",
+                        help="use a cached precompiled preamble")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse PDFs built from identical sources")
+    parser.add_argument("--cache-size", type=float,
+                        default=worksheets.CACHE_SIZE/2**20,
+                        help="PDF cache limit, MB")
+    parser.add_argument("--single", action="store_true",
+                        help="one pdflatex run per target, split afterwards")
+    parser.add_argument("--plan", action="store_true",
+                        help="list the targets and stop")
+    args = parser.parse_args()
+
+    targets = ReadManifest(args.manifest)
+    if (args.plan):
+        Plan(targets)
+        return
+
+    cache = int(args.cache_size*2**20) if args.cache else None
+    failed = Run(targets, args.jobs, args.timeout, args.fmt,
+                 cache, args.single)
+    for target, results in failed:
+        for r in results:
+            if (not r.ok):
+                print("\n%s (manifest line %d):" % (r.tex, target.line), file=sys.stderr)
+                print("\n".join(r.log.splitlines()[-20:]), file=sys.stderr)
+    if (failed):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
+
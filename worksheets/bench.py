@@ -0,0 +1,263 @@
+#
+#  file: bench.py
+#
+#  Time the generators, page assembly and compiles, optionally
+#  against a stored baseline.  Python 3.
+#
+#    python3 bench.py --json base.json
+#    python3 bench.py --baseline base.json
+#
+#  Public domain
+#
+################################################################
+
+import sys
+import os
+import io
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import worksheets
+
+#  ops used for the slower document benchmarks unless --ops is given
+DOCUMENT_OPS = ["add2", "mul1", "divm", "frac1", "pct2"]
+
+#  a pdflatex stand-in: a blank page per \newpage, no TeX
+STUB = """#!%s
+import sys
+sys.path.insert(0, %r)
+import pdf
+if ("--version" in sys.argv):
+    print("pdfTeX stub")
+    sys.exit(0)
+tex = sys.argv[-1]
+with open(tex) as f:
+    pages = f.read().count("\\\\newpage") + 1
+with open(tex[:-4] + ".pdf", "wb") as f:
+    w = pdf.PdfWriter(f, fonts=False)
+    for i in range(pages):
+        w.Page("")
+    w.Close()
+"""
+
+
+################################################################
+#  Timer
+#
+def Timer(f, min_time=0.2):
+    """Seconds per call of f, the best of three runs of at least min_time"""
+
+    n = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(n):
+            f()
+        t = time.perf_counter() - start
+        if (t >= min_time):
+            break
+        n *= 2 if (t == 0) else max(2, int(1.2*min_time/t))
+    best = t
+    for k in range(2):
+        start = time.perf_counter()
+        for i in range(n):
+            f()
+        best = min(best, time.perf_counter() - start)
+    return best / n
+
+
+################################################################
+#  Bench
+#
+class Bench:
+    """Collect named measurements"""
+
+    def __init__(self, min_time=0.2, out=sys.stdout):
+        """Constructor"""
+
+        self.min_time = min_time
+        self.out = out
+        self.metrics = {}
+
+    def Add(self, name, value, unit, better):
+        """Record one measurement, better is "higher" or "lower" """
+
+        self.metrics[name] = {"value": value, "unit": unit, "better": better}
+        print("%-28s %14.6g %s" % (name, value, unit), file=self.out)
+
+    #-----------------------------------------------------------
+    #  Generators
+    #
+    def Generators(self, ops, n=1000):
+        """Problems per second straight from each generator"""
+
+        for op in ops:
+            ws = worksheets.Worksheets(op, 1, "", seed=1)
+            rng = random.Random(1)
+            gen = ws.generate
+            t = Timer(lambda: [gen(rng) for i in range(n)], self.min_time)
+            self.Add("generate/%s" % op, n/t, "problems/s", "higher")
+
+    #-----------------------------------------------------------
+    #  Pages
+    #
+    def Pages(self, ops, backend="latex"):
+        """Pages per second from BuildPage, formatting included"""
+
+        for op in ops:
+            if (backend == "pdf") and (worksheets.PROBLEMS[op].stacks is None):
+                continue
+            ws = worksheets.Worksheets(op, 1, "", seed=1, backend=backend)
+            page = [0]
+            def build():
+                ws.BuildPage(ws.PageRng(page[0]), page=page[0])
+                page[0] += 1
+            t = Timer(build, self.min_time)
+            self.Add("page/%s/%s" % (backend, op), 1/t, "pages/s", "higher")
+
+    #-----------------------------------------------------------
+    #  Documents
+    #
+    def Documents(self, ops, counts):
+        """Seconds to write both documents, and the peak memory doing so"""
+
+        for op in ops:
+            for pages in counts:
+                ws = worksheets.Worksheets(op, pages, "", seed=1)
+                def write():
+                    ws.Write(io.StringIO(), io.StringIO())
+                t = Timer(write, self.min_time)
+                self.Add("write/%s/%d" % (op, pages), t, "s", "lower")
+
+                tracemalloc.start()
+                write()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.Add("peak/%s/%d" % (op, pages), peak, "bytes", "lower")
+
+    #-----------------------------------------------------------
+    #  Compiles
+    #
+    def Compiles(self, ops, counts, stub=False, single=False):
+        """Seconds for Create, .tex files through PDFs, and per pdflatex run"""
+
+        with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+            env = os.environ.get("PATH", "")
+            if (stub):
+                with open(os.path.join(tmp, "pdflatex"), "w") as f:
+                    f.write(STUB % (sys.executable, os.path.dirname(os.path.abspath(__file__))))
+                os.chmod(os.path.join(tmp, "pdflatex"), 0o755)
+                os.environ["PATH"] = tmp + os.pathsep + env
+            try:
+                mode = "single" if single else "create"
+                for op in ops:
+                    for pages in counts:
+                        base = os.path.join(tmp, "%s_%d" % (op, pages))
+                        start = time.perf_counter()
+                        results = worksheets.Worksheets(op, pages, base, seed=1,
+                                                        single=single).Create()
+                        t = time.perf_counter() - start
+                        if (not all(r.ok for r in results)):
+                            print("%s %d pages: pdflatex failed" % (op, pages), file=self.out)
+                            continue
+                        self.Add("%s/%s/%d" % (mode, op, pages), t, "s", "lower")
+                        self.Add("compile/%s/%d" % (op, pages),
+                                 max(r.elapsed for r in results), "s", "lower")
+            finally:
+                os.environ["PATH"] = env
+
+    #-----------------------------------------------------------
+    #  Report
+    #
+    def Report(self):
+        """Everything measured, with what it was measured on"""
+
+        return {"python": platform.python_version(),
+                "machine": platform.machine(),
+                "numpy": worksheets.NumPy() is not None,
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "metrics": self.metrics}
+
+
+################################################################
+#  Compare
+#
+def Compare(report, baseline, tolerance=0.1, out=sys.stdout):
+    """Print each metric against the baseline, return those that regressed"""
+
+    regressed = []
+    old = baseline["metrics"]
+    for name, m in report["metrics"].items():
+        if (name not in old) or (old[name]["value"] == 0):
+            continue
+        ratio = m["value"] / old[name]["value"]
+        if (m["better"] == "higher"):
+            worse = ratio < 1 - tolerance
+        else:
+            worse = ratio > 1 + tolerance
+        if (worse):
+            regressed.append(name)
+        print("%-28s %14.6g %14.6g %7.2fx %s" % (name, old[name]["value"], m["value"],
+              ratio, "REGRESSED" if worse else ""), file=out)
+    return regressed
+
+
+################################################################
+#  main
+#
+def main():
+    """Parse command line"""
+
+    parser = argparse.ArgumentParser(prog="bench",
+                description="Benchmark worksheet generation and compiles")
+    parser.add_argument("--ops", nargs="+", choices=list(worksheets.PROBLEMS),
+                        metavar="op", help="ops to time (default: all, or a few "
+                        "for the document benchmarks)")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100],
+                        help="page counts for the document benchmarks")
+    parser.add_argument("--compile", action="store_true",
+                        help="also time Create with pdflatex")
+    parser.add_argument("--stub", action="store_true",
+                        help="time Create with a stand-in for pdflatex")
+    parser.add_argument("--single", action="store_true",
+                        help="time Create in single-compile mode")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="seconds each timing runs for, at least")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--baseline", help="compare with results saved by --json")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fraction worse than the baseline allowed")
+    args = parser.parse_args()
+
+    ops = args.ops or list(worksheets.PROBLEMS)
+    docs = args.ops or DOCUMENT_OPS
+    b = Bench(args.min_time)
+    b.Generators(ops)
+    b.Pages(ops)
+    b.Pages(ops, "pdf")
+    b.Documents(docs, args.pages)
+    if (args.compile or args.stub):
+        b.Compiles(docs, args.pages, args.stub, args.single)
+
+    report = b.Report()
+    if (args.json):
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+    if (args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        regressed = Compare(report, baseline, args.tolerance)
+        print("%d of %d metrics regressed by more than %d%%" % (len(regressed),
+              len(report["metrics"]), 100*args.tolerance))
+        if (regressed):
+            sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
+
@@ -0,0 +1,163 @@
+#
+#  file: fitcheck.py
+#
+#  Typeset a sample of each problem type's cells with pdflatex and
+#  hold their heights up against what --fit works out from the LaTeX
+#  alone (TexHeight).  With --pdf, check instead that everything the
+#  pdf backend draws stays within the margins.  Python 3.
+#
+#    python3 fitcheck.py
+#    python3 fitcheck.py add2 mul1 --tolerance 0.5
+#    python3 fitcheck.py --pdf
+#
+#  Public domain
+#
+################################################################
+
+import os
+import re
+import sys
+import argparse
+import tempfile
+
+import worksheets
+
+#  each cell in a box as wide as a column, its height to the log
+CELL = ("\\setbox0\\vbox{\\hsize=4cm \\parindent=0pt \\centering\n"
+        "\\everypar{\\vrule height\\ht\\strutbox width0pt\\everypar{}}\n"
+        "%s}\n"
+        "\\typeout{FIT %d \\the\\dimexpr\\ht0+\\dp0\\relax}\n")
+FIT = re.compile(r"^FIT (\d+) ([0-9.]+)pt", re.M)
+
+#  the y of each text baseline and line end in a content stream
+DRAWN = re.compile(r"(-?[0-9.]+) (?:Td|m|l)\b")
+
+
+################################################################
+#  Cells
+#
+def Cells(op, n=8):
+    """(op, part, LaTeX) for n of op's problems, their spacing taken out"""
+
+    ws = worksheets.Worksheets(op, 1, "", seed=1, fit=True)
+    strip = ws.VSPACE.sub
+    cells = []
+    for v in ws.Sample()[:n]:
+        cells.append((op, "problem", strip("", ws.kind.problem(v))))
+        cells.append((op, "solution", strip("", ws.kind.solution(v))))
+    return cells
+
+
+################################################################
+#  Measure
+#
+def Measure(cells, timeout=worksheets.COMPILE_TIMEOUT):
+    """The heights of the cells as pdflatex sets them, in mm, or raise
+    RuntimeError with the end of the log"""
+
+    with tempfile.TemporaryDirectory(prefix="fitcheck-") as tmp:
+        tex = os.path.join(tmp, "cells.tex")
+        with open(tex, "w") as f:
+            f.write(worksheets.Preamble(True) + "\n\\begin{document}\n")
+            for i, (op, part, text) in enumerate(cells):
+                f.write(CELL % (text, i))
+            f.write("\\end{document}\n")
+        r = worksheets.CompileOne(tex, timeout)
+    if (not r.ok):
+        raise RuntimeError("\n".join(r.log.splitlines()[-20:]))
+    heights = {int(i): float(pt)*worksheets.TEX_PT for i, pt in FIT.findall(r.log)}
+    if (len(heights) != len(cells)):
+        raise RuntimeError("%d of %d cells measured" % (len(heights), len(cells)))
+    return [heights[i] for i in range(len(cells))]
+
+
+################################################################
+#  Check
+#
+def Check(ops, tolerance=1.0, timeout=worksheets.COMPILE_TIMEOUT, out=sys.stdout):
+    """Report the worst difference for each op and part, return those
+    more than tolerance mm out"""
+
+    cells = [c for op in ops for c in Cells(op)]
+    measured = Measure(cells, timeout)
+    worst = {}
+    for (op, part, text), m in zip(cells, measured):
+        d = worksheets.TexHeight(text)*worksheets.TEX_PT
+        w = worst.get((op, part))
+        if (w is None) or (abs(d - m) > abs(w[0] - w[1])):
+            worst[op, part] = (d, m)
+
+    bad = []
+    for (op, part), (d, m) in worst.items():
+        off = abs(d - m) > tolerance
+        if (off):
+            bad.append((op, part))
+        print("%-6s %-8s worked out %6.1f mm  pdflatex %6.1f mm  %s" % (op, part,
+              d, m, "OFF" if off else ""), file=out)
+    return bad
+
+
+################################################################
+#  CheckPdf
+#
+def CheckPdf(ops, pages=10, out=sys.stdout):
+    """Draw pages of each op on the pdf backend, fixed and fitted, and
+    return those that draw outside the top and bottom margins"""
+
+    top, bottom = worksheets.pdf.LETTER[1] - 15*worksheets.pdf.MM, 20*worksheets.pdf.MM
+    bad = []
+    for op in ops:
+        if (worksheets.PROBLEMS[op].stacks is None):
+            continue
+        for fit in (False, True):
+            ws = worksheets.Worksheets(op, pages, "", seed=1, backend="pdf", fit=fit)
+            ys = [float(y) for page in ws.Pages() for content in page
+                  for y in DRAWN.findall(content)]
+            off = (min(ys) < bottom - 0.01) or (max(ys) > top + 0.01)
+            if (off):
+                bad.append((op, fit))
+            print("%-6s %-5s y from %6.1f to %6.1f pt  %s" % (op, "fit" if fit else "fixed",
+                  min(ys), max(ys), "OFF" if off else ""), file=out)
+    return bad
+
+
+################################################################
+#  main
+#
+def main():
+    """Parse command line"""
+
+    parser = argparse.ArgumentParser(prog="fitcheck",
+                description="Compare the cell heights --fit works out with pdflatex's")
+    parser.add_argument("ops", nargs="*", metavar="op",
+                        help="ops to check (default: all)")
+    parser.add_argument("--tolerance", type=float, default=1.0,
+                        help="mm a height may be out by")
+    parser.add_argument("--timeout", type=float, default=worksheets.COMPILE_TIMEOUT,
+                        help="seconds allowed for pdflatex")
+    parser.add_argument("--pdf", action="store_true",
+                        help="check the pdf backend's pages against the margins")
+    args = parser.parse_args()
+    for op in args.ops:
+        if (op not in worksheets.PROBLEMS):
+            parser.error("unknown op %s" % op)
+
+    if (args.pdf):
+        bad = CheckPdf(args.ops or list(worksheets.PROBLEMS))
+        print("%d layouts drawn outside the margins" % len(bad))
+        if (bad):
+            sys.exit(1)
+        return
+
+    try:
+        bad = Check(args.ops or list(worksheets.PROBLEMS), args.tolerance, args.timeout)
+    except RuntimeError as e:
+        print("pdflatex failed:\n%s" % e, file=sys.stderr)
+        sys.exit(1)
+    print("%d heights out by more than %0.1f mm" % (len(bad), args.tolerance))
+    if (bad):
+        sys.exit(1)
+
+
+if (__name__ == "__main__"):
+    main()
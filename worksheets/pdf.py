@@ -0,0 +1,626 @@
+#
+#  file: pdf.py
+#
+#  Just enough PDF to draw text and lines with the standard
+#  fonts, no TeX needed, and to split a PDF into page ranges
+#  without any external tools.  Python 3.
+#
+#  Public domain
+#
+################################################################
+
+import re
+import zlib
+
+#  US letter, points
+LETTER = (612, 792)
+
+#  points per mm
+MM = 72/25.4
+
+#  the base fonts used, by resource name
+FONTS = {"F1": "Courier", "F2": "Helvetica"}
+
+#  Courier advance width, in units of the font size
+COURIER = 0.6
+
+
+################################################################
+#  Escape
+#
+def Escape(s):
+    """A PDF string literal, WinAnsi encoded"""
+
+    s = str(s).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return "(" + s + ")"
+
+
+def TextString(s):
+    """A PDF text string, for titles: a literal if plain ASCII, else UTF-16"""
+
+    if (s.isascii()):
+        return Escape(s)
+    return "<FEFF" + s.encode("utf-16-be").hex().upper() + ">"
+
+
+################################################################
+#  Text
+#
+def Text(x, y, s, size=12, font="F1"):
+    """Content stream operators drawing s with its baseline starting at x,y"""
+
+    return "BT /%s %g Tf %.2f %.2f Td %s Tj ET\n" % (font, size, x, y, Escape(s))
+
+
+################################################################
+#  Line
+#
+def Line(x0, y0, x1, y1, width=0.5):
+    """Content stream operators drawing a line"""
+
+    return "%g w %.2f %.2f m %.2f %.2f l S\n" % (width, x0, y0, x1, y1)
+
+
+################################################################
+#  PdfWriter
+#
+class PdfWriter:
+    """Write a PDF a page at a time to a binary file.
+
+    Pages are written as they are added, only the object offsets are
+    kept, so memory does not grow with the page count.
+    """
+
+    def __init__(self, f, size=LETTER, compress=True, fonts=True, version="1.4"):
+        """Constructor"""
+
+        self.f = f
+        self.size = size
+        self.compress = compress
+        self.offsets = {}
+        self.pos = 0
+        self.kids = []
+        self.outlines = []       # (title, page index)
+        self.next = 3            # 1 is the catalog, 2 the page tree
+        self.Out(b"%%PDF-%s\n%%\xe2\xe3\xcf\xd3\n" % version.encode())
+        self.resources = "<< >>"
+        if (not fonts):
+            return
+
+        #  the fonts, shared by every page
+        fonts = []
+        for name, base in FONTS.items():
+            n = self.Object("<< /Type /Font /Subtype /Type1 /BaseFont /%s "
+                            "/Encoding /WinAnsiEncoding >>" % base)
+            fonts.append("/%s %d 0 R" % (name, n))
+        self.resources = "<< /Font << %s >> >>" % " ".join(fonts)
+
+    def Out(self, data):
+        """Write bytes, keeping track of the offset"""
+
+        self.f.write(data)
+        self.pos += len(data)
+
+    def Reserve(self):
+        """An object number to be written later"""
+
+        self.next += 1
+        return self.next - 1
+
+    def Object(self, body, stream=None, n=None):
+        """Write one object, return its number"""
+
+        if (n is None):
+            n = self.next
+            self.next += 1
+        self.offsets[n] = self.pos
+        if (stream is None):
+            self.Out(("%d 0 obj\n%s\nendobj\n" % (n, body)).encode("latin-1"))
+        else:
+            self.Out(("%d 0 obj\n%s\nstream\n" % (n, body)).encode("latin-1"))
+            self.Out(stream)
+            self.Out(b"\nendstream\nendobj\n")
+        return n
+
+    def Page(self, content):
+        """Add a page drawn by the content stream operators in content"""
+
+        data = content.encode("cp1252")
+        if (self.compress):
+            data = zlib.compress(data)
+            c = self.Object("<< /Length %d /Filter /FlateDecode >>" % len(data), data)
+        else:
+            c = self.Object("<< /Length %d >>" % len(data), data)
+        p = self.Object("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %g %g] "
+                        "/Resources %s /Contents %d 0 R >>" % (self.size[0],
+                        self.size[1], self.resources, c))
+        self.kids.append(p)
+        return len(self.kids) - 1
+
+    def Outline(self, title, page=None):
+        """Bookmark a page by index, by default the next one added"""
+
+        self.outlines.append((title, len(self.kids) if (page is None) else page))
+
+    def Close(self):
+        """Write the page tree, outlines, catalog, cross-reference table and trailer"""
+
+        self.Object("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                    " ".join("%d 0 R" % k for k in self.kids), len(self.kids)), n=2)
+
+        catalog = "/Type /Catalog /Pages 2 0 R"
+        if (self.outlines):
+            #  one flat list of items, numbered in order after the root
+            root = self.Reserve()
+            first, n = self.next, len(self.outlines)
+            for i, (title, page) in enumerate(self.outlines):
+                links = ""
+                if (i > 0):
+                    links += " /Prev %d 0 R" % (first+i-1)
+                if (i < n-1):
+                    links += " /Next %d 0 R" % (first+i+1)
+                self.Object("<< /Title %s /Parent %d 0 R /Dest [%d 0 R /XYZ null null null]%s >>"
+                            % (TextString(title), root, self.kids[page], links))
+            self.Object("<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>" % (
+                        first, first+n-1, n), n=root)
+            catalog += " /Outlines %d 0 R /PageMode /UseOutlines" % root
+        self.Object("<< %s >>" % catalog, n=1)
+
+        xref = self.pos
+        lines = ["xref", "0 %d" % self.next, "0000000000 65535 f "]
+        for n in range(1, self.next):
+            lines.append("%010d 00000 n " % self.offsets[n])
+        lines += ["trailer", "<< /Size %d /Root 1 0 R >>" % self.next,
+                  "startxref", "%d" % xref, "%EOF", ""]
+        self.Out("\n".join(lines).encode("latin-1"))
+
+
+################################################################
+#  Reading
+#
+#  PDF objects are read into Python values: dict, list, int, float,
+#  bool, None, bytes for strings, Name for names, Ref for indirect
+#  references and Stream for streams.
+#
+class Name(str):
+    """A PDF name, /Type"""
+
+
+class Ref(tuple):
+    """An indirect reference, n g R"""
+
+    def __new__(cls, n, g=0):
+        return tuple.__new__(cls, (n, g))
+
+
+class Stream:
+    """A stream object, its dictionary and the still encoded data"""
+
+    def __init__(self, dict, data):
+        """Constructor"""
+
+        self.dict = dict
+        self.data = data
+
+    def Decode(self):
+        """The data with its filter removed, FlateDecode only"""
+
+        filters = self.dict.get("Filter", [])
+        if (not isinstance(filters, list)):
+            filters = [filters]
+        data = self.data
+        for f in filters:
+            if (f != "FlateDecode"):
+                raise ValueError("Unsupported filter /%s" % f)
+            data = zlib.decompress(data)
+        parms = self.dict.get("DecodeParms") or {}
+        if (isinstance(parms, list)):
+            parms = parms[0] or {}
+        if (parms.get("Predictor", 1) >= 10):
+            data = Unpredict(data, parms.get("Columns", 1))
+        return data
+
+
+def Unpredict(data, columns):
+    """Undo PNG row prediction, one filter byte per row of columns bytes"""
+
+    out = []
+    prior = bytearray(columns)
+    for i in range(0, len(data), columns+1):
+        kind, row = data[i], bytearray(data[i+1:i+1+columns])
+        for j in range(len(row)):
+            left = row[j-1] if (j > 0) else 0
+            up = prior[j]
+            ul = prior[j-1] if (j > 0) else 0
+            if (kind == 1):
+                row[j] = (row[j] + left) & 255
+            elif (kind == 2):
+                row[j] = (row[j] + up) & 255
+            elif (kind == 3):
+                row[j] = (row[j] + (left + up)//2) & 255
+            elif (kind == 4):
+                p = left + up - ul
+                pa, pb, pc = abs(p-left), abs(p-up), abs(p-ul)
+                row[j] = (row[j] + (left if (pa <= pb and pa <= pc) else
+                                    up if (pb <= pc) else ul)) & 255
+        out.append(bytes(row))
+        prior = row
+    return b"".join(out)
+
+
+TOKEN = re.compile(rb"[^\x00\t\n\x0c\r ()<>\[\]{}/%]+")
+SPACE = re.compile(rb"(?:[\x00\t\n\x0c\r ]|%[^\r\n]*)*")
+INT = re.compile(rb"[+-]?\d+$")
+REF = re.compile(rb"\s+(\d+)\s+R(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])")
+OBJ = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+OCTAL = re.compile(rb"[0-7]{1,3}")
+ESCAPES = {ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b",
+           ord("f"): b"\f", ord("("): b"(", ord(")"): b")", ord("\\"): b"\\"}
+
+
+################################################################
+#  PdfReader
+#
+class PdfReader:
+    """Random access to the objects and pages of a PDF held in memory.
+
+    Reads cross-reference tables and the cross-reference and object
+    streams pdflatex writes for PDF 1.5, following /Prev to older
+    sections.
+    """
+
+    def __init__(self, data):
+        """Constructor"""
+
+        self.data = data
+        m = re.match(rb"%PDF-(\d\.\d)", data)
+        self.version = m.group(1).decode() if m else "1.4"
+        self.xref = {}           # n -> (1, offset) or (2, stream, index)
+        self.objstms = {}
+        self.trailer = {}
+
+        i = data.rfind(b"startxref")
+        if (i < 0):
+            raise ValueError("Not a PDF: no startxref")
+        pos = int(data[i+9:].split()[0])
+        seen = set()
+        while (pos is not None) and (pos not in seen):
+            seen.add(pos)
+            trailer = self.ReadXref(pos)
+            for k, v in trailer.items():
+                self.trailer.setdefault(k, v)
+            if ("XRefStm" in trailer):
+                self.ReadXref(trailer["XRefStm"])
+            pos = trailer.get("Prev")
+
+        self.pages = []
+        self.inherited = []
+        self.tree = set()
+        self.Walk(self.trailer["Root"], {}, set())
+
+    #-----------------------------------------------------------
+    #  Parsing
+    #
+    def Skip(self, data, pos):
+        """Past any white space and comments"""
+
+        return SPACE.match(data, pos).end()
+
+    def Parse(self, data, pos):
+        """The object starting at pos, and the position after it"""
+
+        pos = self.Skip(data, pos)
+        c = data[pos:pos+1]
+        if (c == b"<"):
+            if (data[pos:pos+2] == b"<<"):
+                d = {}
+                pos += 2
+                while True:
+                    pos = self.Skip(data, pos)
+                    if (data[pos:pos+2] == b">>"):
+                        return d, pos+2
+                    key, pos = self.Parse(data, pos)
+                    d[key], pos = self.Parse(data, pos)
+            end = data.index(b">", pos)
+            hexs = re.sub(rb"[^0-9A-Fa-f]", b"", data[pos+1:end])
+            if (len(hexs) % 2):
+                hexs += b"0"
+            return bytes.fromhex(hexs.decode()), end+1
+        if (c == b"["):
+            a = []
+            pos += 1
+            while True:
+                pos = self.Skip(data, pos)
+                if (data[pos:pos+1] == b"]"):
+                    return a, pos+1
+                v, pos = self.Parse(data, pos)
+                a.append(v)
+        if (c == b"("):
+            return self.Literal(data, pos+1)
+        if (c == b"/"):
+            m = TOKEN.match(data, pos+1)
+            raw = m.group(0) if m else b""
+            name = re.sub(rb"#([0-9A-Fa-f]{2})",
+                          lambda h: bytes([int(h.group(1), 16)]), raw)
+            return Name(name.decode("latin-1")), pos+1+len(raw)
+
+        m = TOKEN.match(data, pos)
+        if (m is None):
+            raise ValueError("Unexpected %r at %d" % (c, pos))
+        t = m.group(0)
+        pos = m.end()
+        if (INT.match(t)):
+            #  n g R is a reference
+            m = REF.match(data, pos)
+            if (m):
+                return Ref(int(t), int(m.group(1))), m.end()
+            return int(t), pos
+        if (t == b"true"):
+            return True, pos
+        if (t == b"false"):
+            return False, pos
+        if (t == b"null"):
+            return None, pos
+        try:
+            return float(t), pos
+        except ValueError:
+            return Name(t.decode("latin-1")), pos   # a keyword
+
+    def Literal(self, data, pos):
+        """A (string), pos is just past the opening parenthesis"""
+
+        out = bytearray()
+        depth = 1
+        while True:
+            c = data[pos]
+            pos += 1
+            if (c == 0x5c):                          # backslash
+                c = data[pos]
+                pos += 1
+                if (c in ESCAPES):
+                    out += ESCAPES[c]
+                elif (48 <= c <= 55):                # octal
+                    m = OCTAL.match(data, pos-1)
+                    out.append(int(m.group(0), 8) & 255)
+                    pos = m.end()
+                elif (c == 0x0d):                    # line continuation
+                    if (data[pos:pos+1] == b"\n"):
+                        pos += 1
+                elif (c != 0x0a):
+                    out.append(c)
+                continue
+            if (c == 0x28):
+                depth += 1
+            elif (c == 0x29):
+                depth -= 1
+                if (depth == 0):
+                    return bytes(out), pos
+            out.append(c)
+
+    def Indirect(self, pos):
+        """The n g obj ... endobj at pos, streams included"""
+
+        data = self.data
+        m = OBJ.match(data, pos)
+        if (m is None):
+            raise ValueError("No object at %d" % pos)
+        obj, pos = self.Parse(data, m.end())
+        pos = self.Skip(data, pos)
+        if (isinstance(obj, dict)) and (data[pos:pos+6] == b"stream"):
+            pos += 6
+            if (data[pos:pos+2] == b"\r\n"):
+                pos += 2
+            elif (data[pos:pos+1] in (b"\n", b"\r")):
+                pos += 1
+            n = self.Resolve(obj["Length"])
+            obj = Stream(obj, data[pos:pos+n])
+        return obj
+
+    #-----------------------------------------------------------
+    #  ReadXref
+    #
+    def ReadXref(self, pos):
+        """One cross-reference section, table or stream, returns its trailer"""
+
+        data = self.data
+        if (data[self.Skip(data, pos):].startswith(b"xref")):
+            pos = self.Skip(data, pos) + 4
+            while True:
+                pos = self.Skip(data, pos)
+                if (data[pos:pos+7] == b"trailer"):
+                    return self.Parse(data, pos+7)[0]
+                m = re.compile(rb"(\d+)\s+(\d+)").match(data, pos)
+                first, count = int(m.group(1)), int(m.group(2))
+                pos = self.Skip(data, m.end())
+                for k in range(count):
+                    e = data[pos:pos+20].split()
+                    if (first+k not in self.xref) and (e[2] == b"n"):
+                        self.xref[first+k] = (1, int(e[0]))
+                    pos += 20
+
+        xs = self.Indirect(pos)
+        rows = xs.Decode()
+        w = xs.dict["W"]
+        index = xs.dict.get("Index", [0, xs.dict["Size"]])
+        at = 0
+        for first, count in zip(index[0::2], index[1::2]):
+            for n in range(first, first+count):
+                f = []
+                for k in w:
+                    f.append(int.from_bytes(rows[at:at+k], "big"))
+                    at += k
+                kind = f[0] if w[0] else 1
+                if (n not in self.xref):
+                    if (kind == 1):
+                        self.xref[n] = (1, f[1])
+                    elif (kind == 2):
+                        self.xref[n] = (2, f[1], f[2])
+        return xs.dict
+
+    #-----------------------------------------------------------
+    #  Objects
+    #
+    def Object(self, n):
+        """Object number n, None if it is free or missing"""
+
+        e = self.xref.get(n)
+        if (e is None):
+            return None
+        if (e[0] == 1):
+            return self.Indirect(e[1])
+
+        #  compressed, in an object stream
+        if (e[1] not in self.objstms):
+            s = self.Object(e[1])
+            data = s.Decode()
+            first = s.dict["First"]
+            nums = [int(t) for t in data[:first].split()]
+            self.objstms[e[1]] = (data, first, nums[1::2])
+        data, first, offsets = self.objstms[e[1]]
+        return self.Parse(data, first + offsets[e[2]])[0]
+
+    def Resolve(self, v):
+        """v, with a reference followed"""
+
+        while (isinstance(v, Ref)):
+            v = self.Object(v[0])
+        return v
+
+    #-----------------------------------------------------------
+    #  Walk
+    #
+    #  attributes a page can inherit from the tree above it
+    INHERITED = ["Resources", "MediaBox", "CropBox", "Rotate"]
+
+    def Walk(self, ref, inherit, seen):
+        """Collect the pages, in order, with their inherited attributes"""
+
+        node = self.Resolve(ref)
+        if ("Pages" in node):                       # the catalog
+            self.tree.add(ref)
+            self.Walk(node["Pages"], inherit, seen)
+            return
+        if (ref in seen):
+            return
+        seen.add(ref)
+        if (node.get("Type") == "Pages") or ("Kids" in node):
+            self.tree.add(ref)
+            inherit = dict(inherit)
+            for k in self.INHERITED:
+                if (k in node):
+                    inherit[k] = node[k]
+            for kid in self.Resolve(node["Kids"]):
+                self.Walk(kid, inherit, seen)
+        else:
+            self.pages.append(ref)
+            self.inherited.append(inherit)
+
+    def Dest(self, name):
+        """The index of the page a named destination points to, or None"""
+
+        root = self.Resolve(self.trailer["Root"])
+        names = self.Resolve(root.get("Names")) or {}
+        tree = self.Resolve(names.get("Dests"))
+        dest = self.Lookup(tree, name.encode("latin-1")) if tree else None
+        if (dest is None):
+            dests = self.Resolve(root.get("Dests")) or {}
+            dest = dests.get(name)
+        dest = self.Resolve(dest)
+        if (isinstance(dest, dict)):
+            dest = self.Resolve(dest.get("D"))
+        if (not dest) or (dest[0] not in self.pages):
+            return None
+        return self.pages.index(dest[0])
+
+    def Lookup(self, node, key):
+        """key in a name tree"""
+
+        node = self.Resolve(node)
+        if ("Names" in node):
+            a = self.Resolve(node["Names"])
+            for k, v in zip(a[0::2], a[1::2]):
+                if (self.Resolve(k) == key):
+                    return v
+        for kid in self.Resolve(node.get("Kids", [])):
+            v = self.Lookup(kid, key)
+            if (v is not None):
+                return v
+        return None
+
+
+################################################################
+#  Serialize
+#
+def Serialize(v, ref):
+    """PDF syntax for v, ref maps each Ref to the one to write"""
+
+    if (isinstance(v, Ref)):
+        r = ref(v)
+        return "null" if (r is None) else "%d 0 R" % r
+    if (isinstance(v, Name)):
+        return "/" + re.sub(r"[^!-~]|[#()<>\[\]{}/%]",
+                            lambda m: "#%02X" % ord(m.group(0)), v)
+    if (isinstance(v, bool)):
+        return "true" if v else "false"
+    if (v is None):
+        return "null"
+    if (isinstance(v, int)):
+        return "%d" % v
+    if (isinstance(v, float)):
+        return ("%.6f" % v).rstrip("0").rstrip(".")
+    if (isinstance(v, bytes)):
+        return "<" + v.hex() + ">"
+    if (isinstance(v, list)):
+        return "[" + " ".join(Serialize(x, ref) for x in v) + "]"
+    if (isinstance(v, dict)):
+        return "<<" + " ".join("%s %s" % (Serialize(Name(k), ref), Serialize(x, ref))
+                               for k, x in v.items()) + ">>"
+    raise TypeError("Cannot write %r" % (v,))
+
+
+################################################################
+#  Extract
+#
+def Extract(reader, pages, f, outlines=()):
+    """Write a PDF of the given pages, by index, of reader to binary file f.
+
+    Only the objects the pages use are copied.  References to pages
+    left out, and to the page tree, become null.  outlines are (title,
+    index into pages) bookmarks for the new file.
+    """
+
+    w = PdfWriter(f, fonts=False, version=reader.version)
+    for title, i in outlines:
+        w.Outline(title, i)
+    numbers = {}
+    todo = []
+    keep = set(reader.pages[i] for i in pages)
+
+    def ref(r):
+        if (r in reader.tree) or ((r in reader.pages) and (r not in keep)):
+            return None
+        if (r not in numbers):
+            numbers[r] = w.Reserve()
+            todo.append(r)
+        return numbers[r]
+
+    for i in pages:
+        page = dict(reader.Resolve(reader.pages[i]))
+        for k, v in reader.inherited[i].items():
+            page.setdefault(k, v)
+        page.pop("Parent", None)
+        n = ref(reader.pages[i])
+        todo.remove(reader.pages[i])
+        w.Object("<</Parent 2 0 R " + Serialize(page, ref)[2:], n=n)
+        w.kids.append(n)
+
+    while (todo):
+        r = todo.pop()
+        obj = reader.Object(r[0])
+        if (isinstance(obj, Stream)):
+            d = dict(obj.dict)
+            d["Length"] = len(obj.data)
+            w.Object(Serialize(d, ref), obj.data, n=numbers[r])
+        else:
+            w.Object(Serialize(obj, ref), n=numbers[r])
+    w.Close()
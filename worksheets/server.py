@@ -0,0 +1,391 @@
+#
+#  file: server.py
+#
+#  Serve worksheets over HTTP from a pool of warm worker processes,
+#  keeping recently built PDFs in memory.  Python 3.
+#
+#    GET /worksheet?op=add2&pages=3&seed=7[&part=solutions][&backend=pdf]
+#    GET /stats
+#
+#  --banks DIR draws the problems from DIR/<op>.bank, see bank.py.
+#
+#  Public domain
+#
+################################################################
+
+import sys
+import os
+import time
+import json
+import random
+import asyncio
+import argparse
+import collections
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+
+import worksheets
+
+#  largest request accepted
+MAX_PAGES = 100
+
+#  default in-memory cache limit, bytes
+MEMORY_SIZE = 64*1024*1024
+
+#  latencies kept for the stats
+HISTORY = 1000
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+################################################################
+#  Render
+#
+def Render(op, pages, seed, backend, timeout, fmt, banks=None):
+    """Build one worksheet in memory, runs in a worker.
+
+    Problems come from banks/<op>.bank when there is one.  Returns the
+    problems and solutions PDFs as bytes, or None and the tail of the
+    pdflatex log if a compile failed.
+    """
+
+    bank = None
+    if (banks is not None) and (os.path.exists(os.path.join(banks, op + ".bank"))):
+        bank = Bank(os.path.join(banks, op + ".bank"))
+    try:
+        pdfs = worksheets.Render(op, pages, seed, backend, timeout=timeout,
+                                 fmt=fmt, bank=bank)
+    except worksheets.CompileError as e:
+        return None, "\n".join(e.log.splitlines()[-20:])
+    return (pdfs["problems"], pdfs["solutions"]), None
+
+
+#  banks mapped by this worker, by file name
+_banks = {}
+
+def Bank(fname):
+    """The bank in fname, mapped once per worker"""
+
+    if (fname not in _banks):
+        _banks[fname] = worksheets.Pool.Map(fname)
+    return _banks[fname]
+
+
+################################################################
+#  MemoryCache
+#
+class MemoryCache:
+    """Least recently used rendered worksheets, bounded in bytes"""
+
+    def __init__(self, limit=MEMORY_SIZE):
+        """Constructor"""
+
+        self.limit = limit
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def Get(self, key):
+        """The cached value for key, or None"""
+
+        value = self.entries.get(key)
+        if (value is None):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def Put(self, key, value):
+        """Keep value, a tuple of bytes, dropping the oldest entries to fit"""
+
+        size = sum(len(v) for v in value)
+        if (size > self.limit):
+            return
+        if (key in self.entries):
+            self.bytes -= sum(len(v) for v in self.entries.pop(key))
+        self.entries[key] = value
+        self.bytes += size
+        while (self.bytes > self.limit):
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= sum(len(v) for v in old)
+
+    def Stats(self):
+        """Entry count, size and hit rate"""
+
+        return {"entries": len(self.entries), "bytes": self.bytes,
+                "limit": self.limit, "hits": self.hits, "misses": self.misses}
+
+
+################################################################
+#  Server
+#
+class Server:
+    """Queue requests onto a bounded pool of worker processes"""
+
+    def __init__(self, jobs=None, queue=64, memory=MEMORY_SIZE,
+                 timeout=worksheets.COMPILE_TIMEOUT, fmt=False, banks=None):
+        """Constructor"""
+
+        self.jobs = jobs or os.cpu_count()
+        self.timeout = timeout
+        self.fmt = fmt
+        self.banks = banks
+        self.cache = MemoryCache(memory)
+        self.queue = asyncio.Queue(maxsize=queue)
+        self.pending = {}        # key -> future, so repeats share one build
+        self.busy = 0
+        self.served = 0
+        self.rejected = 0
+        self.failed = 0
+        self.latency = collections.deque(maxlen=HISTORY)
+        self.build = collections.deque(maxlen=HISTORY)
+        self.pool = None
+        self.workers = []
+
+    #-----------------------------------------------------------
+    #  Start
+    #
+    def Start(self):
+        """Start the worker processes and the tasks feeding them"""
+
+        if (self.fmt):
+            #  dump the shared preamble once, before the workers need it
+            worksheets.PreambleFormat(self.timeout, out=sys.stderr)
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs)
+        #  fork the workers now rather than on the first request
+        for _ in range(self.jobs):
+            self.pool.submit(int)
+        self.workers = [asyncio.ensure_future(self.Worker()) for _ in range(self.jobs)]
+
+    def Stop(self):
+        """Cancel the feeding tasks and shut the pool down"""
+
+        for w in self.workers:
+            w.cancel()
+        self.pool.shutdown()
+
+    #-----------------------------------------------------------
+    #  Worker
+    #
+    async def Worker(self):
+        """Take requests off the queue, one at a time, and build them"""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            key, fut = await self.queue.get()
+            self.busy += 1
+            start = time.perf_counter()
+            try:
+                value = await loop.run_in_executor(self.pool, Render, *key,
+                                                   self.timeout, self.fmt, self.banks)
+                if (not fut.done()):
+                    fut.set_result(value)
+            except Exception as e:
+                if (not fut.done()):
+                    fut.set_result((None, "%s: %s" % (type(e).__name__, e)))
+            finally:
+                self.build.append(time.perf_counter() - start)
+                self.busy -= 1
+                del self.pending[key]
+                self.queue.task_done()
+
+    #-----------------------------------------------------------
+    #  Get
+    #
+    async def Get(self, key):
+        """The PDFs for key, from memory, a build in progress or a new build.
+
+        Returns (pdfs, error); pdfs is None if the request was refused
+        (error is None) or the build failed.
+        """
+
+        value = self.cache.Get(key)
+        if (value is not None):
+            return value, None
+
+        fut = self.pending.get(key)
+        if (fut is None):
+            if (self.queue.full()):
+                self.rejected += 1
+                return None, None
+            fut = asyncio.get_running_loop().create_future()
+            self.pending[key] = fut
+            self.queue.put_nowait((key, fut))
+
+        #  a client going away does not cancel the build the others wait on
+        value, error = await asyncio.shield(fut)
+        if (value is not None):
+            self.cache.Put(key, value)
+        return value, error
+
+    #-----------------------------------------------------------
+    #  Stats
+    #
+    def Stats(self):
+        """Queue depth, cache and latency figures"""
+
+        def percentiles(xs):
+            xs = sorted(xs)
+            if (not xs):
+                return {}
+            at = lambda p: 1000*xs[min(len(xs)-1, int(p*len(xs)))]
+            return {"p50_ms": at(0.5), "p90_ms": at(0.9), "p99_ms": at(0.99),
+                    "max_ms": 1000*xs[-1]}
+
+        return {"workers": self.jobs, "busy": self.busy,
+                "queued": self.queue.qsize(), "queue_limit": self.queue.maxsize,
+                "pending": len(self.pending), "served": self.served,
+                "rejected": self.rejected, "failed": self.failed,
+                "cache": self.cache.Stats(),
+                "latency": percentiles(self.latency),
+                "build": percentiles(self.build)}
+
+    #-----------------------------------------------------------
+    #  Request
+    #
+    async def Request(self, method, target):
+        """Answer one request, returns (status, content type, body, headers)"""
+
+        url = urlsplit(target)
+        if (method != "GET"):
+            return 405, "text/plain", b"GET only\n", {}
+        if (url.path == "/stats"):
+            return 200, "application/json", json.dumps(self.Stats(), indent=1).encode(), {}
+        if (url.path != "/worksheet"):
+            return 404, "text/plain", b"not found\n", {}
+
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        op = q.get("op", "")
+        part = q.get("part", "problems")
+        backend = q.get("backend", "latex")
+        try:
+            pages = int(q.get("pages", "1"))
+            seed = int(q["seed"]) if ("seed" in q) else random.getrandbits(63)
+        except ValueError:
+            return 400, "text/plain", b"pages and seed must be integers\n", {}
+        if (op not in worksheets.PROBLEMS):
+            return 400, "text/plain", ("unknown op %s\n" % op).encode(), {}
+        if (not (1 <= pages <= MAX_PAGES)):
+            return 400, "text/plain", ("pages must be 1 to %d\n" % MAX_PAGES).encode(), {}
+        if (part not in ["problems", "solutions"]):
+            return 400, "text/plain", b"part is problems or solutions\n", {}
+        if (backend not in ["latex", "pdf"]):
+            return 400, "text/plain", b"backend is latex or pdf\n", {}
+        if (backend == "pdf") and (worksheets.PROBLEMS[op].stacks is None):
+            return 400, "text/plain", ("%s needs the latex backend\n" % op).encode(), {}
+
+        value, error = await self.Get((op, pages, seed, backend))
+        if (value is None):
+            if (error is None):
+                return 503, "text/plain", b"queue full, try again\n", {"Retry-After": "1"}
+            self.failed += 1
+            return 500, "text/plain", (error + "\n").encode(), {}
+        body = value[0] if (part == "problems") else value[1]
+        return 200, "application/pdf", body, {"X-Seed": "%d" % seed}
+
+    #-----------------------------------------------------------
+    #  Connection
+    #
+    async def Connection(self, reader, writer):
+        """Serve requests on one connection until the client is done"""
+
+        try:
+            while True:
+                line = await reader.readline()
+                if (not line):
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if (h in [b"\r\n", b"\n", b""]):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+
+                start = time.perf_counter()
+                t = line.decode("latin-1").split()
+                if (len(t) != 3):
+                    status, ctype, body, extra = 400, "text/plain", b"bad request\n", {}
+                else:
+                    status, ctype, body, extra = await self.Request(t[0], t[1])
+                if (status == 200):
+                    self.served += 1
+                    self.latency.append(time.perf_counter() - start)
+
+                close = (headers.get("connection", "").lower() == "close") or \
+                        (len(t) == 3 and t[2] == "HTTP/1.0")
+                head = ["HTTP/1.1 %d %s" % (status, REASONS[status]),
+                        "Content-Type: %s" % ctype,
+                        "Content-Length: %d" % len(body)]
+                head += ["%s: %s" % kv for kv in extra.items()]
+                if (close):
+                    head.append("Connection: close")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if (close):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+################################################################
+#  Serve
+#
+async def Serve(server, host, port):
+    """Run until cancelled"""
+
+    server.Start()
+    listener = await asyncio.start_server(server.Connection, host, port)
+    print("serving on http://%s:%d/ with %d workers" % (host, port, server.jobs),
+          file=sys.stderr)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.Stop()
+
+
+################################################################
+#  main
+#
+def main():
+    """Parse command line"""
+
+    parser = argparse.ArgumentParser(prog="server",
+                description="Serve worksheets over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--queue", type=int, default=64,
+                        help="requests waiting for a worker before refusing more")
+    parser.add_argument("--memory", type=float, default=MEMORY_SIZE/2**20,
+                        help="in-memory PDF cache limit, MB")
+    parser.add_argument("--timeout", type=float, default=worksheets.COMPILE_TIMEOUT,
+                        help="seconds allowed per pdflatex run")
+    parser.add_argument("--fmt", action="store_true",
+                        help="use a cached precompiled preamble")
+    parser.add_argument("--banks",
+                        help="directory of <op>.bank files made by bank.py")
+    args = parser.parse_args()
+
+    async def run():
+        server = Server(args.jobs, args.queue, int(args.memory*2**20),
+                        args.timeout, args.fmt, args.banks)
+        await Serve(server, args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if (__name__ == "__main__"):
+    main()
+
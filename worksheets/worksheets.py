@@ -12,10 +12,827 @@
 
 import sys
 import os
+import io
+import time
 import binascii
+import hashlib
+import zlib
+import math
 import random
-from decimal import Decimal
-from fractions import Fraction
+import shutil
+import csv
+import copy
+import mmap
+import array
+import struct
+import re
+import json
+import argparse
+import operator
+import functools
+import itertools
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import pdf
+
+#  NumPy is optional and slow to import, see NumPy()
+np = None
+
+
+#  how long a single pdflatex run may take, seconds
+COMPILE_TIMEOUT = 120
+
+#  where precompiled formats (and other build products) are kept
+CACHE_DIR = os.environ.get("WORKSHEETS_CACHE",
+                os.path.join(os.path.expanduser("~"), ".cache", "worksheets"))
+
+#  default size bound of the PDF cache, bytes
+CACHE_SIZE = 256*1024*1024
+
+
+################################################################
+#  CompileResult
+#
+class CompileResult:
+    """The outcome of one pdflatex run"""
+
+    def __init__(self, tex, returncode, elapsed, log, timedout=False, cached=False,
+                 pdf=None):
+        """Constructor"""
+
+        self.tex = tex
+        self.pdf = pdf or (os.path.splitext(tex)[0] + ".pdf")
+        self.returncode = returncode
+        self.elapsed = elapsed
+        self.log = log
+        self.timedout = timedout
+        self.cached = cached
+
+    @property
+    def ok(self):
+        """True if the PDF was produced"""
+
+        return (self.returncode == 0) and (not self.timedout)
+
+    def __repr__(self):
+        state = "timeout" if self.timedout else "rc=%s" % self.returncode
+        if (self.cached):
+            state = "cached"
+        return "CompileResult(%r, %s, %0.2fs)" % (self.tex or self.pdf, state, self.elapsed)
+
+
+################################################################
+#  Compile
+#
+def CompileOne(tex, timeout=COMPILE_TIMEOUT, fmt=None):
+    """Run pdflatex once, in batch mode, next to the .tex file"""
+
+    folder, name = os.path.split(os.path.abspath(tex))
+    cmd = ["pdflatex", "-interaction=nonstopmode", "-halt-on-error",
+           "-file-line-error", name]
+    env = None
+    if (fmt is not None):
+        #  look in the cache first, then the usual places
+        cmd.insert(1, "-fmt=%s" % fmt)
+        env = dict(os.environ, TEXFORMATS=CACHE_DIR + os.pathsep)
+    start = time.perf_counter()
+    try:
+        p = subprocess.run(cmd, cwd=folder, stdin=subprocess.DEVNULL,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           timeout=timeout, env=env)
+    except subprocess.TimeoutExpired as e:
+        log = (e.output or b"").decode("utf-8", "replace")
+        return CompileResult(tex, None, time.perf_counter()-start, log, True)
+    except OSError as e:
+        return CompileResult(tex, None, time.perf_counter()-start, str(e))
+    log = p.stdout.decode("utf-8", "replace")
+    return CompileResult(tex, p.returncode, time.perf_counter()-start, log)
+
+
+def CompileCached(tex, timeout=COMPILE_TIMEOUT, fmt=None, cache=None):
+    """Copy the PDF from the cache if the source was built before, else compile"""
+
+    if (cache is None):
+        return CompileOne(tex, timeout, fmt)
+
+    start = time.perf_counter()
+    key = cache.Key(tex, fmt)
+    pdf = os.path.splitext(tex)[0] + ".pdf"
+    if (cache.Get(key, pdf)):
+        return CompileResult(tex, 0, time.perf_counter()-start, "", cached=True)
+    r = CompileOne(tex, timeout, fmt)
+    if (r.ok):
+        cache.Put(key, pdf)
+    return r
+
+
+def Compile(texs, timeout=COMPILE_TIMEOUT, fmt=None, cache=None):
+    """Compile several .tex files at the same time, return their results"""
+
+    texs = list(texs)
+    with ThreadPoolExecutor(max_workers=max(1,len(texs))) as pool:
+        return list(pool.map(lambda t: CompileCached(t, timeout, fmt, cache), texs))
+
+
+################################################################
+#  Format
+#
+_version = None
+
+def PdflatexVersion():
+    """First line of pdflatex --version, or None if there is no pdflatex"""
+
+    global _version
+    if (_version is None):
+        try:
+            p = subprocess.run(["pdflatex", "--version"], stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            _version = p.stdout.decode("utf-8", "replace").split("\n")[0]
+        except OSError:
+            _version = ""
+    return _version or None
+
+
+def Format(preamble, timeout=COMPILE_TIMEOUT):
+    """Return the name of a cached format holding preamble, dumping it if needed.
+
+    The name is derived from the preamble text and the pdflatex version,
+    so a changed preamble or toolchain gets a new format.  Returns None
+    if the format cannot be built.
+    """
+
+    version = PdflatexVersion()
+    if (version is None):
+        return None
+    key = hashlib.sha1((version + "\n" + preamble).encode("utf-8")).hexdigest()
+    name = "ws-" + key[:16]
+    if (os.path.exists(os.path.join(CACHE_DIR, name + ".fmt"))):
+        return name
+
+    #  dump under a private job name, then move into place, so that
+    #  concurrent builds never see a partial format
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    job = "%s-%d" % (name, os.getpid())
+    with open(os.path.join(CACHE_DIR, job + ".tex"), "w") as f:
+        f.write(preamble + "\n\\dump\n")
+    cmd = ["pdflatex", "-ini", "-interaction=nonstopmode", "-halt-on-error",
+           "-jobname=%s" % job, "&pdflatex", job + ".tex"]
+    try:
+        p = subprocess.run(cmd, cwd=CACHE_DIR, stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           timeout=timeout)
+        if (p.returncode == 0):
+            os.replace(os.path.join(CACHE_DIR, job + ".fmt"),
+                       os.path.join(CACHE_DIR, name + ".fmt"))
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+    for ext in [".tex", ".log", ".fmt"]:
+        try:
+            os.remove(os.path.join(CACHE_DIR, job + ext))
+        except OSError:
+            pass
+
+    if (os.path.exists(os.path.join(CACHE_DIR, name + ".fmt"))):
+        return name
+    return None
+
+
+################################################################
+#  Preamble
+#
+def Preamble(fit=False):
+    """Everything before \\begin{document}, the same for every document
+    of a layout"""
+
+    return "\n".join([
+            "\\documentclass[12pt]{article}",
+            "\\usepackage{geometry}",
+            "\\geometry{letterpaper,left=20mm,top=15mm%s}" % (
+                ",bottom=20mm" if fit else ""),
+            "\\usepackage{array}",
+            "% long division, worked out in Python:",
+            "% \\longdiv{quotient}{divisor}{dividend}{\\ldstep{product}{remainder}...}",
+            "\\def\\ldstep#1#2{$\\underline{#1\\strut}$\\cr#2\\strut\\cr\\noalign{\\kern-.2ex}}",
+            "\\def\\longdiv#1#2#3#4{%",
+            " \\vtop{\\normalbaselines \\offinterlineskip",
+            "   \\setbox\\strutbox\\hbox{\\vrule height 2.1ex depth .5ex width0ex}%",
+            "   \\tabskip=0pt",
+            "   \\halign{\\hfil##\\cr % \\halign for entire division problem",
+            "     $#1$\\strut\\cr",
+            "     #2$\\,\\overline{\\vphantom{\\big)}%",
+            "     \\hbox{\\smash{\\raise3.5\\fontdimen8\\textfont3\\hbox{$\\big)$}}}%",
+            "     \\mkern2mu #3}$\\cr\\noalign{\\kern-.2ex}",
+            "     #4\\cr % one \\ldstep per nonzero digit of the quotient",
+            "}}}"])
+
+
+def PreambleFormat(timeout=COMPILE_TIMEOUT, fit=False, out=None):
+    """The format holding the preamble, dumped now if it has to be, so
+    that workers started afterwards all find it.  None if it cannot be
+    built, which is said on out if given."""
+
+    name = Format(Preamble(fit), timeout)
+    if (name is None) and (out is not None):
+        print("could not build the preamble format, compiling in full", file=out)
+    return name
+
+
+################################################################
+#  PdfCache
+#
+class PdfCache:
+    """Compiled PDFs on disk, keyed by a hash of their LaTeX source.
+
+    Entries are evicted least recently used first once the total size
+    passes the limit.  A hit touches the entry's mtime.
+    """
+
+    def __init__(self, limit=CACHE_SIZE, folder=None):
+        """Constructor"""
+
+        self.folder = folder or os.path.join(CACHE_DIR, "pdf")
+        self.limit = limit
+        self.hits = self.misses = self.stores = self.evictions = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    def Key(self, tex, fmt=None):
+        """Hash of the source, the format used and the pdflatex version"""
+
+        h = hashlib.sha256()
+        h.update(("%s\n%s\n" % (PdflatexVersion() or "", fmt or "")).encode("utf-8"))
+        with open(tex, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def Path(self, key):
+        """Where an entry lives"""
+
+        return os.path.join(self.folder, key + ".pdf")
+
+    def Get(self, key, dest):
+        """Copy a cached PDF to dest, return False on a miss"""
+
+        try:
+            shutil.copyfile(self.Path(key), dest)
+            os.utime(self.Path(key))
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def Put(self, key, pdf):
+        """Store a freshly built PDF"""
+
+        tmp = "%s.%d.tmp" % (self.Path(key), os.getpid())
+        try:
+            shutil.copyfile(pdf, tmp)
+            os.replace(tmp, self.Path(key))
+        except OSError:
+            return
+        self.stores += 1
+        self.Evict()
+
+    def Entries(self):
+        """(mtime, size, path) of every entry, oldest first"""
+
+        entries = []
+        for name in os.listdir(self.folder):
+            if (not name.endswith(".pdf")):
+                continue
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, os.path.join(self.folder, name)))
+        return sorted(entries)
+
+    def Evict(self):
+        """Drop the least recently used entries until under the limit"""
+
+        entries = self.Entries()
+        total = sum(e[1] for e in entries)
+        for _, size, path in entries:
+            if (total <= self.limit):
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+
+    def Stats(self):
+        """Counters for this process plus the state on disk"""
+
+        entries = self.Entries()
+        return {"folder": self.folder, "entries": len(entries),
+                "bytes": sum(e[1] for e in entries), "limit": self.limit,
+                "hits": self.hits, "misses": self.misses,
+                "stores": self.stores, "evictions": self.evictions}
+
+    def Report(self, out=sys.stdout):
+        """Print the stats"""
+
+        st = self.Stats()
+        print("cache %s: %d entries, %0.1f of %0.1f MB" % (st["folder"],
+              st["entries"], st["bytes"]/2**20, st["limit"]/2**20), file=out)
+        print("  %d hits, %d misses, %d stored, %d evicted" % (st["hits"],
+              st["misses"], st["stores"], st["evictions"]), file=out)
+
+
+################################################################
+#  Profile
+#
+class Profile:
+    """Timing spans, counts and peak memory for one build.
+
+    Spans are totalled by name; the first few of each are also kept
+    as events for a trace.  Nothing calls into this unless a Profile
+    is given to Worksheets.
+    """
+
+    def __init__(self, memory=True, events=10000):
+        """Constructor"""
+
+        self.memory = memory
+        self.limit = events
+        self.spans = {}          # name -> [count, total, max]
+        self.events = []
+        self.peak = None
+        self.origin = time.perf_counter()
+
+    def Add(self, name, start, elapsed):
+        """Record one span"""
+
+        s = self.spans.get(name)
+        if (s is None):
+            s = self.spans[name] = [0, 0.0, 0.0]
+        s[0] += 1
+        s[1] += elapsed
+        if (elapsed > s[2]):
+            s[2] = elapsed
+        if (s[0] <= self.limit):
+            self.events.append((name, start, elapsed))
+
+    @contextlib.contextmanager
+    def Span(self, name):
+        """Time the body of a with statement"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.Add(name, start, time.perf_counter() - start)
+
+    def Wrap(self, name, f):
+        """f, with each call timed"""
+
+        clock = time.perf_counter
+        add = self.Add
+        def timed(*args, **kw):
+            start = clock()
+            try:
+                return f(*args, **kw)
+            finally:
+                add(name, start, clock() - start)
+        return timed
+
+    def Start(self):
+        """Start tracing allocations, if asked to"""
+
+        if (self.memory) and (not tracemalloc.is_tracing()):
+            tracemalloc.start()
+
+    def Stop(self):
+        """Note the peak allocation"""
+
+        if (self.memory) and (tracemalloc.is_tracing()):
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def Summary(self, out=sys.stderr):
+        """Print a table of the spans"""
+
+        wall = self.spans.get("create", [1, 0.0, 0.0])[1] or 1e-9
+        print("%-12s %8s %10s %10s %10s %7s" % ("span", "count", "total s",
+              "mean ms", "max ms", "% wall"), file=out)
+        for name, (n, total, most) in self.spans.items():
+            print("%-12s %8d %10.3f %10.3f %10.3f %7.1f" % (name, n, total,
+                  1000*total/n, 1000*most, 100*total/wall), file=out)
+        if (self.peak is not None):
+            print("peak memory %0.1f MB" % (self.peak/2**20), file=out)
+
+    def Trace(self):
+        """The spans as a Chrome trace (chrome://tracing, Perfetto), with the totals"""
+
+        events = [{"name": name, "ph": "X", "pid": 0, "tid": 0,
+                   "ts": 1e6*(start - self.origin), "dur": 1e6*elapsed}
+                  for name, start, elapsed in self.events]
+        spans = {name: {"count": n, "total": total, "max": most}
+                 for name, (n, total, most) in self.spans.items()}
+        return {"traceEvents": events, "spans": spans, "peak": self.peak}
+
+
+################################################################
+#  LongDivision
+#
+class LongDivision:
+    """dividend / divisor worked out digit by digit, as on paper.
+
+    steps holds (product, remainder) for each nonzero digit of the
+    quotient: the digit times the divisor, shifted to its place, and
+    what is left of the dividend after subtracting it.
+    """
+
+    def __init__(self, dividend, divisor):
+        """Constructor"""
+
+        self.dividend = dividend
+        self.divisor = divisor
+        self.quotient, self.remainder = divmod(dividend, divisor)
+        self.steps = []
+
+        rest = dividend
+        digits = str(self.quotient)
+        for k, c in enumerate(digits):
+            p = int(c) * divisor * 10**(len(digits)-1-k)
+            if (p > 0):
+                rest -= p
+                self.steps.append((p, rest))
+
+    def __repr__(self):
+        return "LongDivision(%d, %d)" % (self.dividend, self.divisor)
+
+
+################################################################
+#  Fixed
+#
+def Fixed(m, e, places=0):
+    """m * 10**-e written out in decimal, with at least places decimals.
+
+    Exact: the digits of m are placed, no float or Decimal in between.
+    """
+
+    if (places > e):
+        m, e = m * 10**(places-e), places
+    s = "%d" % abs(m)
+    if (e > 0):
+        s = s.rjust(e+1, "0")
+        s = s[:-e] + "." + s[-e:]
+    return "-" + s if (m < 0) else s
+
+
+def RoundDiv(n, d):
+    """n / d rounded to the nearest integer, halves away from zero, d > 0"""
+
+    q = (2*abs(n) + d) // (2*d)
+    return -q if (n < 0) else q
+
+
+################################################################
+#  TexEscape
+#
+TEX_SPECIAL = {"\\": "\\textbackslash{}", "{": "\\{", "}": "\\}", "$": "\\$",
+               "&": "\\&", "#": "\\#", "%": "\\%", "_": "\\_",
+               "^": "\\textasciicircum{}", "~": "\\textasciitilde{}"}
+
+def TexEscape(s):
+    """s as LaTeX text"""
+
+    return "".join(TEX_SPECIAL.get(c, c) for c in s)
+
+
+def Plain(s):
+    """s in plain ASCII, accents dropped, for PDF bookmarks and headers"""
+
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(c for c in s if c.isascii() and not unicodedata.combining(c))
+
+
+################################################################
+#  TexHeight
+#
+#  How tall a cell's LaTeX comes out, worked out from the LaTeX itself
+#  with the metrics of the 12pt article class in Computer Modern: the
+#  baselineskip of each size, which is also the height of a tabular
+#  row, the x-height the long division is built from, the rule under
+#  \hline and character widths for wrapping a line of text.
+#  fitcheck.py holds these up against what pdflatex makes of them.
+#
+TEX_PT = 25.4 / 72.27                           # mm
+TEX_SIZES = [("\\small", 10.95), ("\\large", 14.4)]
+TEX_SKIP = {10.95: 13.6, 12: 14.5, 14.4: 18}    # baselineskip at each size
+TEX_RULE = 0.4                                  # \arrayrulewidth
+TEX_WIDTH = 4 * 72.27 / 2.54                    # a 4cm cell
+TEX_TOKEN = re.compile(r"(\\begin\{tabular\}\{[^}]*\}|\\end\{tabular\}|\\\\|\\hline)")
+TEX_VERB = re.compile(r"\\verb\|([^|]*)\|")
+TEX_COMMAND = re.compile(r"\\[a-zA-Z]+|[{}$]")
+
+def TexHeight(text):
+    """The height, in points, text comes out in a 4cm cell"""
+
+    size = 12
+    for command, pt in TEX_SIZES:
+        if (command in text):
+            size = pt
+    ex = 0.43*size
+
+    if ("\\longdiv" in text):
+        #  rows 2.6ex deep, the quotient, the dividend and two per step,
+        #  less a 0.2ex kern after the dividend and each step
+        steps = text.count("\\ldstep")
+        return (2 + 2*steps)*2.6*ex - (steps + 1)*0.2*ex
+    parts = TEX_TOKEN.split(text)
+    for i, p in enumerate(parts):
+        if (p.startswith("\\begin{tabular}")):
+            return TexTabular(parts, i+1, TEX_SKIP[size])[0]
+
+    #  a paragraph, wrapped at the cell's width; a display fraction
+    #  takes two lines' height
+    tt = sum(len(t) for t in TEX_VERB.findall(text))
+    rest = TEX_COMMAND.sub("", TEX_VERB.sub("", text)).strip()
+    lines = max(1, math.ceil((0.525*tt + 0.5*len(rest))*size / TEX_WIDTH))
+    if ("\\frac" in text):
+        return lines*2*size
+    return lines*TEX_SKIP[size]
+
+
+def TexTabular(parts, i, skip):
+    """The height of the tabular whose body starts at parts[i], the LaTeX
+    split at TEX_TOKEN, and the index of what follows it"""
+
+    height = row = 0
+    filled = False
+    while (i < len(parts)):
+        p = parts[i]
+        i += 1
+        if (p.startswith("\\begin{tabular}")):
+            #  a tabular in a cell makes the row as tall as it is
+            h, i = TexTabular(parts, i, skip)
+            row, filled = max(row, h), True
+        elif (p == "\\end{tabular}"):
+            break
+        elif (p == "\\hline"):
+            height += TEX_RULE
+        elif (p == "\\\\"):
+            height, row, filled = height + max(skip, row), 0, False
+        elif (p.strip()):
+            filled = True
+    if (filled):
+        height += max(skip, row)
+    return height, i
+
+
+################################################################
+#  NumPy
+#
+def NumPy():
+    """The numpy module, imported on first use, or None if not installed"""
+
+    global np
+    if (np is None):
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = False
+    return np or None
+
+
+################################################################
+#  CarrySampler
+#
+class CarrySampler:
+    """Operands with an exact number of carries, or borrows, built a
+    column at a time.
+
+    For each column the digits are drawn from a table of every digit
+    tuple giving the wanted carry out of the carry in, so nothing is
+    ever rejected.  The carry out of each column is chosen with weights
+    counting the ways to finish the rest, which makes every operand
+    tuple with k carries equally likely.  A carry into a new leading
+    digit of a sum counts, a subtraction never borrows past its top
+    column.
+    """
+
+    samplers = {}
+
+    def __init__(self, m, digits, sub=False):
+        """Constructor, m operands of the given number of digits"""
+
+        self.m = m
+        self.digits = digits
+        self.sub = sub
+        carries = range(2 if sub else m)
+
+        #  (carry in, carry out, leading column) -> digit tuples
+        self.table = {}
+        for lead in [False, True]:
+            lo = 1 if lead else 0
+            for d in itertools.product(range(lo, 10), repeat=m):
+                for cin in carries:
+                    if (sub):
+                        t = d[0] - d[1] - cin
+                        cout = 1 if (t < 0) else 0
+                        if (lead and cout):
+                            continue
+                    else:
+                        cout = (sum(d) + cin) // 10
+                    self.table.setdefault((cin, cout, lead), []).append(d)
+
+        #  ways[j][c][r]: ways to fill columns j.. with carry in c and r carries
+        n = digits
+        ways = [[[0]*(n+1) for c in carries] for j in range(n+1)]
+        for c in carries:
+            ways[n][c][0] = 1
+        for j in range(n-1, -1, -1):
+            lead = (j == n-1)
+            for c in carries:
+                for r in range(n+1):
+                    ways[j][c][r] = sum(len(self.table.get((c, o, lead), ())) *
+                                        ways[j+1][o][r - (o > 0)]
+                                        for o in carries if (r - (o > 0) >= 0))
+        self.ways = ways
+
+        #  (column, carry in, carries left) -> carry outs, cumulative weights
+        self.steps = {}
+        for j in range(n):
+            lead = (j == n-1)
+            for c in carries:
+                for r in range(n+1):
+                    outs, cum, total = [], [], 0
+                    for o in carries:
+                        if (r - (o > 0) >= 0):
+                            total += len(self.table.get((c, o, lead), ())) * ways[j+1][o][r - (o > 0)]
+                            outs.append(o)
+                            cum.append(total)
+                    self.steps[j, c, r] = (outs, cum)
+
+    @classmethod
+    def Get(cls, m, digits, sub=False):
+        """A shared sampler, the tables are built once"""
+
+        key = (m, digits, sub)
+        if (key not in cls.samplers):
+            cls.samplers[key] = CarrySampler(m, digits, sub)
+        return cls.samplers[key]
+
+    def Count(self, k):
+        """How many operand tuples have exactly k carries"""
+
+        return self.ways[0][0][k] if (0 <= k <= self.digits) else 0
+
+    def Sample(self, rng, k):
+        """A list of m operands, with exactly k carries"""
+
+        if (self.Count(k) == 0):
+            raise ValueError("No %d-digit operands with %d carries" % (self.digits, k))
+        ops = [0]*self.m
+        c = 0
+        place = 1
+        for j in range(self.digits):
+            outs, cum = self.steps[j, c, k]
+            o = rng.choices(outs, cum_weights=cum)[0]
+            d = rng.choice(self.table[c, o, j == self.digits-1])
+            for i in range(self.m):
+                ops[i] += d[i]*place
+            k -= (o > 0)
+            c = o
+            place *= 10
+        return ops
+
+
+################################################################
+#  Operands
+#
+class Operands:
+    """Operands and answers for n problems of one integer or fixed point op,
+    drawn in bulk.
+
+    Uses NumPy when it is installed, otherwise random.Random.choices,
+    either way a handful of calls per column rather than one per number.
+    The same seed gives the same pool, but not the same problems as the
+    one-at-a-time generators.  Each row holds the same values, in the
+    same order, as the op's generator returns.
+    """
+
+    OPS = ["add2","add3","add4","addm","subm","sub","muls","mul1","mul2",
+           "mul3","div1","divm","dmult","pct1","pct2"] + ["md%d" % d for d in range(2,10)]
+
+    def __init__(self, op, n, seed=None, numpy=True):
+        """Constructor"""
+
+        if (op not in Operands.OPS):
+            raise ValueError("No batched generator for %s" % op)
+        self.op = op
+        self.n = n
+        self.np = NumPy() if numpy else None
+        if (self.np is not None):
+            self.rng = self.np.random.default_rng(seed)
+        else:
+            self.rng = random.Random(seed)
+        self.columns = self.Draw(op, n)
+
+    def Ints(self, lo, hi, n):
+        """n uniform integers in [lo, hi]"""
+
+        if (self.np is not None):
+            return self.rng.integers(lo, hi+1, n, dtype=self.np.int64)
+        return self.rng.choices(range(lo, hi+1), k=n)
+
+    def Apply(self, f, *cols):
+        """Elementwise f over columns, vectorized when possible"""
+
+        if (self.np is not None):
+            return f(*cols)
+        return [f(*t) for t in zip(*cols)]
+
+    def Draw(self, op, n):
+        """The columns for op"""
+
+        add = lambda *t: sum(t)
+
+        if (op in ["add2","add3","add4"]):
+            k = int(op[-1])
+            cols = [self.Apply(lambda x: x+100, self.Ints(1,3999,n)) for i in range(k)]
+            return cols + [self.Apply(add, *cols)]
+        if (op == "addm"):
+            A, B = self.Ints(-999,999,n), self.Ints(-999,999,n)
+            return [A, B, self.Apply(lambda a,b: a+b, A, B)]
+        if (op == "subm"):
+            A, B = self.Ints(-999,999,n), self.Ints(-999,999,n)
+            return [A, B, self.Apply(lambda a,b: a-b, A, B)]
+        if (op == "sub"):
+            A = self.Apply(lambda a: a+1000, self.Ints(1,3999,n))
+            if (self.np is not None):
+                B = self.rng.integers(1, A+1)
+            else:
+                B = [int(u*a)+1 for u, a in zip([self.rng.random() for i in range(n)], A)]
+            return [A, B, self.Apply(lambda a,b: a-b, A, B)]
+        if (op == "muls"):
+            A, B = self.Ints(9999,19997,n), self.Ints(2,9,n)
+            return [A, B, self.Apply(lambda a,b: a*b, A, B)]
+        if (op == "mul1") or (op[:2] == "md"):
+            cols = []
+            for i in range(4):
+                A = self.Ints(2,9,n)
+                B = self.Ints(2,9,n) if (op == "mul1") else self.Ints(int(op[-1]),int(op[-1]),n)
+                cols += [A, B, self.Apply(lambda a,b: a*b, A, B)]
+            return cols
+        if (op == "mul2"):
+            A, B = self.Ints(10,99,n), self.Ints(10,99,n)
+            return [A, B, self.Apply(lambda a,b: a*(b%10), A, B),
+                    self.Apply(lambda a,b: a*(b//10)*10, A, B),
+                    self.Apply(lambda a,b: a*b, A, B)]
+        if (op == "mul3"):
+            A, B = self.Ints(100,999,n), self.Ints(100,999,n)
+            return [A, B, self.Apply(lambda a,b: a*(b%10), A, B),
+                    self.Apply(lambda a,b: a*((b//10)%10)*10, A, B),
+                    self.Apply(lambda a,b: a*(b//100)*100, A, B),
+                    self.Apply(lambda a,b: a*b, A, B)]
+        if (op == "dmult"):
+            #  fixed point: mantissas and places, see Worksheets.Dmult
+            A = self.Apply(lambda h,l: 10*h + l, self.Ints(0,999,n), self.Ints(1,9,n))
+            B0, B1 = self.Ints(1,9,n), self.Ints(1,9,n)
+            sA, sB = self.Ints(0,1,n), self.Ints(0,1,n)
+            mA = self.Apply(lambda s,a: (2*s-1)*a, sA, A)
+            mB = self.Apply(lambda s,b1,b0: (2*s-1)*(10*b1 + b0), sB, B1, B0)
+            return [mA, self.Ints(1,4,n), mB, self.Ints(1,4,n),
+                    self.Apply(lambda a,b0: a*b0, A, B0),
+                    self.Apply(lambda a,b1: a*b1*10, A, B1),
+                    self.Apply(lambda a,b: a*b, mA, mB)]
+        if (op == "pct1"):
+            p, m = self.Ints(1,100,n), self.Ints(10,1000,n)
+            return [p, m, self.Apply(lambda a,b: a*b, p, m)]
+        if (op == "pct2"):
+            A = self.Ints(10,100,n)
+            if (self.np is not None):
+                d = self.rng.integers(1, A)
+            else:
+                d = [int(u*(a-1))+1 for u, a in zip([self.rng.random() for i in range(n)], A)]
+            s = self.Apply(lambda s: 2*s-1, self.Ints(0,1,n))
+            return [A, self.Apply(lambda a,s,d: a + s*d, A, s, d),
+                    self.Apply(lambda a,s,d: s*((200000*d + a) // (2*a)), A, s, d)]
+        D = self.Ints(1000,99999,n)
+        d = self.Ints(2,9,n) if (op == "div1") else self.Ints(10,999,n)
+        return [D, d, self.Apply(lambda a,b: a//b, D, d),
+                self.Apply(lambda a,b: a%b, D, d)]
+
+    def __len__(self):
+        return self.n
+
+    def Rows(self):
+        """Iterate over the rows as tuples of ints"""
+
+        cols = [c.tolist() if hasattr(c, "tolist") else c for c in self.columns]
+        return zip(*cols)
 
 
 ################################################################
@@ -24,49 +841,25 @@ from fractions import Fraction
 class Worksheets:
     """Create some worksheets"""
 
+    #-----------------------------------------------------------
+    #  Preamble
+    #
+    def Preamble(self):
+        """Everything before \\begin{document}, the same for every document"""
+
+        return Preamble(self.fit)
+
+
     #-----------------------------------------------------------
     #  Prelude
     #
     def Prelude(self):
         """What comes before"""
 
-        return "\n".join([
-                "\\documentclass[12pt]{article}",
-                "\\usepackage{geometry}",
-                "\\geometry{letterpaper,left=20mm,top=15mm}",
-                "\\usepackage{array}",
-                "\\newcount\\gpten % (global) power-of-ten -- tells which digit we are doing",
-                "\\countdef\\rtot2 % running total -- remainder so far",
-                "\\countdef\\LDscratch4 % scratch",
-                "\\def\\longdiv#1#2{%",
-                " \\vtop{\\normalbaselines \\offinterlineskip",
-                "   \\setbox\\strutbox\\hbox{\\vrule height 2.1ex depth .5ex width0ex}%",
-                "   \\def\\showdig{$\\underline{\\the\\LDscratch\\strut}$\\cr\\the\\rtot\\strut\\cr",
-                "       \\noalign{\\kern-.2ex}}%",
-                "   \\global\\rtot=#1\\relax",
-                "   \\count0=\\rtot\\divide\\count0by#2\\edef\\quotient{\\the\\count0}%\\show\\quotient",
-                "   % make list macro out of digits in quotient:",
-                "   \\def\\temp##1{\\ifx##1\\temp\\else \\noexpand\\dodig ##1\\expandafter\\temp\\fi}%",
-                "   \\edef\\routine{\\expandafter\\temp\\quotient\\temp}%",
-                "   % process list to give power-of-ten:",
-                "   \\def\\dodig##1{\\global\\multiply\\gpten by10 }\\global\\gpten=1 \\routine",
-                "   % to display effect of one digit in quotient (zero ignored):",
-                "   \\def\\dodig##1{\\global\\divide\\gpten by10",
-                "      \\LDscratch =\\gpten",
-                "      \\multiply\\LDscratch  by##1%",
-                "      \\multiply\\LDscratch  by#2%",
-                "      \\global\\advance\\rtot-\\LDscratch \\relax",
-                "      \\ifnum\\LDscratch>0 \\showdig \\fi % must hide \\cr in a macro to skip it",
-                "   }%",
-                "   \\tabskip=0pt",
-                "   \\halign{\\hfil##\\cr % \\halign for entire division problem",
-                "     $\\quotient$\\strut\\cr",
-                "     #2$\\,\\overline{\\vphantom{\\big)}%",
-                "     \\hbox{\\smash{\\raise3.5\\fontdimen8\\textfont3\\hbox{$\\big)$}}}%",
-                "     \\mkern2mu \\the\\rtot}$\\cr\\noalign{\\kern-.2ex}",
-                "     \\routine \\cr % do each digit in quotient",
-                "}}}",
-                "\\begin{document}\n"])
+        if (self.format is not None):
+            #  the preamble is already in the format
+            return "%%&%s\n\\begin{document}\n" % self.format
+        return self.Preamble() + "\n\\begin{document}\n"
 
 
     #-----------------------------------------------------------
@@ -78,698 +871,1298 @@ class Worksheets:
         return "\\end{document}\n"
 
 
+    #-----------------------------------------------------------
+    #  Subtraction
+    #
+    SUB_ANS = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+               "    & \\verb|%d| \\\\\n"
+               "$-$ & \\verb|%d| \\\\\n"
+               "\\hline\n"
+               "\\end{tabular}}\n\\vspace{29mm}\n")
+    SUB_SOL = ("{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
+               "    & \\verb|%d| \\\\\n"
+               "$-$ & \\verb|%d| \\\\\n"
+               "\\hline\n"
+               " & \\verb|%d| \\\\\n"
+               "\\end{tabular}}\n\\vspace{23mm}\n")
+
+
     #-----------------------------------------------------------
     #  Sub
     #
-    def Sub(self):
+    def Sub(self, rng):
         """Sub two positive integers"""
 
-        A = random.randint(1,3999) + 1000
-        B = random.randint(1,A)
+        A = rng.randint(1,3999) + 1000
+        B = rng.randint(1,A)
         C = A-B
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("    & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("$-$ & \\verb|%d| \\\\" % B) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{29mm}\n"
-
-        sol  = "{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
-        sol += ("    & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("$-$ & \\verb|%d| \\\\" % B) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % C) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{23mm}\n"
-
-        return sol, ans
+        return A, B, C
 
 
     #-----------------------------------------------------------
     #  SubNice
     #
-    def SubNice(self):
+    def SubNice(self, rng):
         """Sub two positive integers without borrowing"""
-        
-        A = ""
-        for i in range(4):
-            A += str(random.randint(1,9))
-        b = random.randint(0,int(A[0]))
-        if (b == 0):
-            B = " "
-        else:
-            B = str(b)
-        for i in range(3):
-            B += str(random.randint(0,int(A[i+1])))
-        A = int(A)
-        B = int(B)
+
+        a = [rng.randint(1,9) for i in range(4)]
+        b = [rng.randint(0,x) for x in a]
+        A = B = 0
+        for x, y in zip(a, b):
+            A = 10*A + x
+            B = 10*B + y
         C = A-B
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("    & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("$-$ & \\verb|%d| \\\\" % B) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{29mm}\n"
+        return A, B, C
 
-        sol  = "{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
-        sol += ("    & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("$-$ & \\verb|%d| \\\\" % B) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % C) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{23mm}\n"
 
-        return sol, ans
+    #-----------------------------------------------------------
+    #  SubBorrow
+    #
+    def SubBorrow(self, k, rng):
+        """Sub two four-digit integers with exactly k borrows"""
+
+        A, B = CarrySampler.Get(2, 4, sub=True).Sample(rng, k)
+
+        return A, B, A-B
 
 
     #-----------------------------------------------------------
     #  Subm
     #
-    def Subm(self):
+    def Subm(self, rng):
         """Subtract two positive or negative integers"""
 
-        A = random.randint(-999,999)
-        B = random.randint(-999,999)
+        A = rng.randint(-999,999)
+        B = rng.randint(-999,999)
         C = A-B
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("    & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("$-$ & \\verb|%d| \\\\" % B) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{29mm}\n"
+        return A, B, C
 
-        sol  = "{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
-        sol += ("    & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("$-$ & \\verb|%d| \\\\" % B) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % C) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{23mm}\n"
 
-        return sol, ans
+    #-----------------------------------------------------------
+    #  Addition
+    #
+    ADD_ANS = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+               "    & \\verb|%d| \\\\\n"
+               "$+$ & \\verb|%d| \\\\\n"
+               "\\hline\n"
+               "\\end{tabular}}\n\\vspace{29mm}\n")
+    ADD_SOL = ("{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
+               "    & \\verb|%d| \\\\\n"
+               "$+$ & \\verb|%d| \\\\\n"
+               "\\hline\n"
+               " & \\verb|%d| \\\\\n"
+               "\\end{tabular}}\n\\vspace{23mm}\n")
 
 
     #-----------------------------------------------------------
     #  Addm
     #
-    def Addm(self):
+    def Addm(self, rng):
         """Add two positive or negative integers"""
 
-        A = random.randint(-999,999)
-        B = random.randint(-999,999)
+        A = rng.randint(-999,999)
+        B = rng.randint(-999,999)
         C = A+B
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("    & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("$+$ & \\verb|%d| \\\\" % B) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{29mm}\n"
-
-        sol  = "{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
-        sol += ("    & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("$+$ & \\verb|%d| \\\\" % B) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % C) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{23mm}\n"
-
-        return sol, ans
+        return A, B, C
 
 
     #-----------------------------------------------------------
     #  Add2
     #
-    def Add2(self):
+    def Add2(self, rng):
         """Add two positive integers"""
 
-        A = random.randint(1,3999) + 100
-        B = random.randint(1,3999) + 100
+        A = rng.randint(1,3999) + 100
+        B = rng.randint(1,3999) + 100
         C = A+B
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("    & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("$+$ & \\verb|%d| \\\\" % B) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{29mm}\n"
+        return A, B, C
+
+
+    #-----------------------------------------------------------
+    #  AddCarry
+    #
+    def AddCarry(self, m, k, rng):
+        """Add m four-digit integers with exactly k carries"""
 
-        sol  = "{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
-        sol += ("    & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("$+$ & \\verb|%d| \\\\" % B) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % C) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{23mm}\n"
+        ops = CarrySampler.Get(m, 4).Sample(rng, k)
 
-        return sol, ans
+        return tuple(ops) + (sum(ops),)
 
 
     #-----------------------------------------------------------
     #  Add3
     #
-    def Add3(self):
+    ADD3_ANS = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+                "    & \\verb|%d| \\\\\n"
+                "    & \\verb|%d| \\\\\n"
+                "$+$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                "\\end{tabular}}\n\\vspace{26mm}\n")
+    ADD3_SOL = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+                "    & \\verb|%d| \\\\\n"
+                "    & \\verb|%d| \\\\\n"
+                "$+$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                " & \\verb|%d| \\\\\n"
+                "\\end{tabular}}\n\\vspace{20mm}\n")
+
+
+    def Add3(self, rng):
         """Add three positive integers"""
 
-        A = random.randint(1,3999) + 100
-        B = random.randint(1,3999) + 100
-        C = random.randint(1,3999) + 100
+        A = rng.randint(1,3999) + 100
+        B = rng.randint(1,3999) + 100
+        C = rng.randint(1,3999) + 100
         D = A+B+C
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("    & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("    & \\verb|%d| \\\\" % B) + "\n"
-        ans += ("$+$ & \\verb|%d| \\\\" % C) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{26mm}\n"
-
-        sol  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        sol += ("    & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("    & \\verb|%d| \\\\" % B) + "\n"
-        sol += ("$+$ & \\verb|%d| \\\\" % C) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % D) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{20mm}\n"
-
-        return sol, ans
+        return A, B, C, D
 
 
     #-----------------------------------------------------------
     #  Add4
     #
-    def Add4(self):
+    ADD4_ANS = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+                "    & \\verb|%d| \\\\\n"
+                "    & \\verb|%d| \\\\\n"
+                "    & \\verb|%d| \\\\\n"
+                "$+$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                "\\end{tabular}}\n\\vspace{20mm}\n")
+    ADD4_SOL = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+                "    & \\verb|%d| \\\\\n"
+                "    & \\verb|%d| \\\\\n"
+                "    & \\verb|%d| \\\\\n"
+                "$+$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                " & \\verb|%d| \\\\\n"
+                "\\end{tabular}}\n\\vspace{16mm}\n")
+
+
+    def Add4(self, rng):
         """Add four positive integers"""
 
-        A = random.randint(1,3999) + 100
-        B = random.randint(1,3999) + 100
-        C = random.randint(1,3999) + 100
-        D = random.randint(1,3999) + 100
+        A = rng.randint(1,3999) + 100
+        B = rng.randint(1,3999) + 100
+        C = rng.randint(1,3999) + 100
+        D = rng.randint(1,3999) + 100
         E = A+B+C+D
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("    & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("    & \\verb|%d| \\\\" % B) + "\n"
-        ans += ("    & \\verb|%d| \\\\" % C) + "\n"
-        ans += ("$+$ & \\verb|%d| \\\\" % D) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{20mm}\n"
-
-        sol  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        sol += ("    & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("    & \\verb|%d| \\\\" % B) + "\n"
-        sol += ("    & \\verb|%d| \\\\" % C) + "\n"
-        sol += ("$+$ & \\verb|%d| \\\\" % D) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % E) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{16mm}\n"
-
-        return sol, ans
+        return A, B, C, D, E
 
 
     #-----------------------------------------------------------
     #  Muls
     #
-    def Muls(self):
+    MULS_ANS = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+                "          & \\verb|%d| \\\\\n"
+                "$\\times$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                "\\end{tabular}}\n\\vspace{20mm}\n")
+    MULS_SOL = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+                "          & \\verb|%d| \\\\\n"
+                "$\\times$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                " & \\verb|%d| \\\\\n"
+                "\\end{tabular}}\n\\vspace{16mm}\n")
+
+
+    def Muls(self, rng):
         """Multi-digit times single-digit"""
 
-        A = 9999 + random.randint(0,9998)
-        B = random.randint(2,9)
+        A = 9999 + rng.randint(0,9998)
+        B = rng.randint(2,9)
         C = A*B
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("          & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("$\\times$ & \\verb|%d| \\\\" % B) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{20mm}\n"
-
-        sol  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        sol += ("          & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("$\\times$ & \\verb|%d| \\\\" % B) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % C) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{16mm}\n"
-        return sol, ans
+        return A, B, C
 
 
     #-----------------------------------------------------------
     #  Mul1
     #
-    def Mul1(self):
+    #  a page cell holds four products, two by two, see Mul1Problem
+    MUL1_ONE = "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n"
+    MUL1_ONE_SOL = "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n"
+    MUL1_HEAD = "{\\large \\begin{tabular}{cc}\n\\ & \\ \\\\\n"
+    MUL1_GAP = "\\ & \\ \\\\\n\\ & \\ \\\\\n"
+    MUL1_TAIL = "\\end{tabular}}\n\\vspace{3mm}\n"
+
+
+    def Mul1(self, rng):
         """Single-digit multiplication, all digits"""
 
-        A = random.randint(2,9)
-        B = random.randint(2,9)
-        C = random.randint(2,9)
-        D = random.randint(2,9)
-        E = random.randint(2,9)
-        F = random.randint(2,9)
-        G = random.randint(2,9)
-        H = random.randint(2,9)
-
-        ans  = "{\\large \\begin{tabular}{cc}\n"
-        ans += "\\ & \\ \\\\\n"
-        ans += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n" % (A,B)
-        ans += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n" % (C,D)
-        ans += "\\ & \\ \\\\\n"
-        ans += "\\ & \\ \\\\\n"
-        ans += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n" % (E,F)
-        ans += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n" % (G,H)
-        ans += "\\end{tabular}}\n"
-        ans += "\\vspace{3mm}\n"
-
-        sol  = "{\\large \\begin{tabular}{cc}\n"
-        sol += "\\ & \\ \\\\\n"
-        sol += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n" % (A,B,A*B)
-        sol += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n" % (C,D,C*D)
-        sol += "\\ & \\ \\\\\n"
-        sol += "\\ & \\ \\\\\n"
-        sol += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n" % (E,F,E*F)
-        sol += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n" % (G,H,G*H)
-        sol += "\\end{tabular}}\n"
-        sol += "\\vspace{3mm}\n"
-
-        return sol, ans
+        A = rng.randint(2,9)
+        B = rng.randint(2,9)
+        C = rng.randint(2,9)
+        D = rng.randint(2,9)
+        E = rng.randint(2,9)
+        F = rng.randint(2,9)
+        G = rng.randint(2,9)
+        H = rng.randint(2,9)
+
+        return A,B,A*B, C,D,C*D, E,F,E*F, G,H,G*H
+
+    def Mul1Unrank(self, items, rng):
+        """Mul1 from four indices into the 64 pairs of digits 2-9"""
+
+        t = MUL1_PAIRS
+        return t[items[0]] + t[items[1]] + t[items[2]] + t[items[3]]
+
+    @staticmethod
+    def Mul1Problem(v):
+        """LaTeX for four products, from the table of cells"""
+
+        c = MUL1_CELLS
+        return (Worksheets.MUL1_HEAD + c[v[0],v[1]] + c[v[3],v[4]] +
+                Worksheets.MUL1_GAP + c[v[6],v[7]] + c[v[9],v[10]] + Worksheets.MUL1_TAIL)
+
+    @staticmethod
+    def Mul1Solution(v):
+        """LaTeX for four products with their answers, from the table of cells"""
+
+        c = MUL1_CELLS
+        return (Worksheets.MUL1_HEAD + c[v[0:3]] + c[v[3:6]] +
+                Worksheets.MUL1_GAP + c[v[6:9]] + c[v[9:12]] + Worksheets.MUL1_TAIL)
 
 
     #-----------------------------------------------------------
     #  Mul2
     #
-    def Mul2(self):
+    MUL2_ANS = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+                "          & \\verb|%d| \\\\\n"
+                "$\\times$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                "\\end{tabular}}\n\\vspace{33mm}\n")
+    MUL2_SOL = ("{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
+                "          & \\verb|%d| \\\\\n"
+                "$\\times$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                "         & \\verb|%d| \\\\\n"
+                "+        & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                " & \\verb|%d| \\\\\n"
+                "\\end{tabular}}\n\\vspace{14mm}\n")
+
+
+    def Mul2(self, rng):
         """Multiply two two-digit integers"""
 
-        A0 = random.randint(0,9)
-        A1 = random.randint(1,9)
+        A0 = rng.randint(0,9)
+        A1 = rng.randint(1,9)
         A = 10*A1 + A0
-        B0 = random.randint(0,9)
-        B1 = random.randint(1,9)
+        B0 = rng.randint(0,9)
+        B1 = rng.randint(1,9)
         B = 10*B1 + B0
         C = A*B0
         D = A*B1*10
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("          & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("$\\times$ & \\verb|%d| \\\\" % B) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{33mm}\n"
-
-        sol  = "{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
-        sol += ("          & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("$\\times$ & \\verb|%d| \\\\" % B) + "\n"
-        sol += "\\hline\n"
-        sol += ("         & \\verb|%d| \\\\" % C) + "\n"
-        sol += ("+        & \\verb|%d| \\\\" % D) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % (A*B)) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{14mm}\n"
-
-        return sol, ans
+        return A, B, C, D, A*B
 
 
     #-----------------------------------------------------------
     #  Mul3
     #
-    def Mul3(self):
+    MUL3_ANS = MUL2_ANS
+    MUL3_SOL = ("{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
+                "          & \\verb|%d| \\\\\n"
+                "$\\times$ & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                "         & \\verb|%d| \\\\\n"
+                "         & \\verb|%d| \\\\\n"
+                "+        & \\verb|%d| \\\\\n"
+                "\\hline\n"
+                " & \\verb|%d| \\\\\n"
+                "\\end{tabular}}\n\\vspace{8mm}\n")
+
+
+    def Mul3(self, rng):
         """Multiply two three-digit integers"""
 
-        A0 = random.randint(0,9)
-        A1 = random.randint(0,9)
-        A2 = random.randint(1,9)
+        A0 = rng.randint(0,9)
+        A1 = rng.randint(0,9)
+        A2 = rng.randint(1,9)
         A = 100*A2 + 10*A1 + A0
-        B0 = random.randint(0,9)
-        B1 = random.randint(0,9)
-        B2 = random.randint(1,9)
+        B0 = rng.randint(0,9)
+        B1 = rng.randint(0,9)
+        B2 = rng.randint(1,9)
         B = 100*B2 + 10*B1 + B0
         C = A*B0
         D = A*B1*10
         E = A*B2*100
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("          & \\verb|%d| \\\\" % A) + "\n"
-        ans += ("$\\times$ & \\verb|%d| \\\\" % B) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{33mm}\n"
-
-        sol  = "{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
-        sol += ("          & \\verb|%d| \\\\" % A) + "\n"
-        sol += ("$\\times$ & \\verb|%d| \\\\" % B) + "\n"
-        sol += "\\hline\n"
-        sol += ("         & \\verb|%d| \\\\" % C) + "\n"
-        sol += ("         & \\verb|%d| \\\\" % D) + "\n"
-        sol += ("+        & \\verb|%d| \\\\" % E) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%d| \\\\" % (A*B)) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{8mm}\n"
-
-        return sol, ans
+        return A, B, C, D, E, A*B
 
 
     #-----------------------------------------------------------
     #  Md
     #
-    def Md(self, d):
+    def Md(self, d, rng):
         """Single-digit multiplication for digit d"""
 
-        A = random.randint(2,9)
-        B = random.randint(2,9)
-        C = random.randint(2,9)
-        D = random.randint(2,9)
-
-        ans  = "{\\large \\begin{tabular}{cc}\n"
-        ans += "\\ & \\ \\\\\n"
-        ans += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n" % (A,d)
-        ans += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n" % (B,d)
-        ans += "\\ & \\ \\\\\n"
-        ans += "\\ & \\ \\\\\n"
-        ans += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n" % (C,d)
-        ans += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\\\ \\end{tabular} \\\n" % (D,d)
-        ans += "\\end{tabular}}\n"
-        ans += "\\vspace{3mm}\n"
-
-        sol  = "{\\large \\begin{tabular}{cc}\n"
-        sol += "\\ & \\ \\\\\n"
-        sol += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n" % (A,d,A*d)
-        sol += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n" % (B,d,B*d)
-        sol += "\\ & \\ \\\\\n"
-        sol += "\\ & \\ \\\\\n"
-        sol += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n" % (C,d,C*d)
-        sol += "\\begin{tabular}{rr} & \\verb|%d| \\\\ $\\times$ & \\verb|%d| \\\\ \\hline & \\verb|%d| \\\\ \\end{tabular} \\\n" % (D,d,D*d)
-        sol += "\\end{tabular}}\n"
-        sol += "\\vspace{3mm}\n"
-
-        return sol, ans
+        A = rng.randint(2,9)
+        B = rng.randint(2,9)
+        C = rng.randint(2,9)
+        D = rng.randint(2,9)
+
+        return A,d,A*d, B,d,B*d, C,d,C*d, D,d,D*d
+
+    def MdUnrank(self, d, items, rng):
+        """Md from four indices into the 8 digits 2-9"""
+
+        t = MD_TRIPLES[d]
+        return t[items[0]] + t[items[1]] + t[items[2]] + t[items[3]]
 
 
     #-----------------------------------------------------------
     #  Dmult
     #
-    def Dmult(self):
+    DMULT_ANS = ("\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
+                 "          & \\verb|%s| \\\\\n"
+                 "$\\times$ & \\verb|%s| \\\\\n"
+                 "\\hline\n"
+                 "\\end{tabular}}\n\\vspace{33mm}\n")
+    DMULT_SOL = ("{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
+                 "          & \\verb|%s| \\\\\n"
+                 "$\\times$ & \\verb|%s| \\\\\n"
+                 "\\hline\n"
+                 "         & \\verb|%d| \\\\\n"
+                 "         & \\verb|%d| \\\\\n"
+                 "\\hline\n"
+                 " & \\verb|%s| \\\\\n"
+                 "\\end{tabular}}\n\\vspace{8mm}\n")
+
+    def Dmult(self, rng):
         """Multiply two decimal numbers"""
 
-        A0 = random.randint(1,9)
-        A1 = random.randint(0,9)
-        A2 = random.randint(0,9)
-        A3 = random.randint(0,9)
-        a = random.randint(1,4)
-        sA= +1 if (random.random() < 0.5) else -1
+        A0 = rng.randint(1,9)
+        A1 = rng.randint(0,9)
+        A2 = rng.randint(0,9)
+        A3 = rng.randint(0,9)
+        a = rng.randint(1,4)
+        sA= +1 if (rng.random() < 0.5) else -1
         A = 1000*A3 + 100*A2 + 10*A1 + A0
-        fa= Decimal(sA*A)*Decimal(10)**Decimal(-a)
-        
-        B0 = random.randint(1,9)
-        B1 = random.randint(1,9)
-        b = random.randint(1,4)
-        sB= +1 if (random.random() < 0.5) else -1
+
+        B0 = rng.randint(1,9)
+        B1 = rng.randint(1,9)
+        b = rng.randint(1,4)
+        sB= +1 if (rng.random() < 0.5) else -1
         B = 10*B1 + B0
-        fb= Decimal(sB*B)*Decimal(10)**Decimal(-b)
-        
-        C = sA*A*sB*B
-        fc = fa * fb
-        
+
         D0 = A*B0
         D1 = A*B1*10
 
-        ans  = "\\vspace{4mm}\n{\\large \\begin{tabular}{cr}\n"
-        ans += ("          & \\verb|%s| \\\\" % fa) + "\n"
-        ans += ("$\\times$ & \\verb|%s| \\\\" % fb) + "\n"
-        ans += "\\hline\n"
-        ans += "\\end{tabular}}\n\\vspace{33mm}\n"
+        #  sA*A/10^a times sB*B/10^b, the answer has a+b places
+        return sA*A, a, sB*B, b, D0, D1, sA*A*sB*B
+
+    @staticmethod
+    def DmultText(v):
+        """The operands, partial products and answer of Dmult, the decimals
+        written out"""
+
+        mA, a, mB, b, D0, D1, mC = v
+        return Fixed(mA, a), Fixed(mB, b), D0, D1, Fixed(mC, a+b)
 
-        sol  = "{\\vspace{4mm}\n\\large \\begin{tabular}{cr}\n"
-        sol += ("          & \\verb|%s| \\\\" % fa) + "\n"
-        sol += ("$\\times$ & \\verb|%s| \\\\" % fb) + "\n"
-        sol += "\\hline\n"
-        sol += ("         & \\verb|%d| \\\\" % D0) + "\n"
-        sol += ("         & \\verb|%d| \\\\" % D1) + "\n"
-        sol += "\\hline\n"
-        sol += (" & \\verb|%s| \\\\" % fc) + "\n"
-        sol += "\\end{tabular}}\n\\vspace{8mm}\n"
+    @staticmethod
+    def DmultProblem(v):
+        """LaTeX for the values of Dmult"""
 
-        return sol, ans
+        return Worksheets.DMULT_ANS % (Fixed(v[0], v[1]), Fixed(v[2], v[3]))
 
+    @staticmethod
+    def DmultSolution(v):
+        """LaTeX for the values of Dmult, worked"""
+
+        return Worksheets.DMULT_SOL % Worksheets.DmultText(v)
+
+
+    #-----------------------------------------------------------
+    #  Division
+    #
+    DIV_ANS = ("{\\setlength\\tabcolsep{2pt} \\begin{tabular}{rcl}\n"
+               " & & \\\\"
+               " \\cline{2-3}\n"
+               "\\verb|%d| & ) & \\verb|%d|\\\\ \n"
+               "\\end{tabular}}\n\\vspace{44mm}\n")
+    DIV_SOL = "{\\small\\quad\\longdiv{%d}{%d}{%d}{%s}}\\vspace{3mm}\n"
+    DIV_STEP = "\\ldstep{%d}{%d}"
+
+    @staticmethod
+    def DivSolution(v):
+        """LaTeX for the worked long division of the values (D, d, q, r)"""
+
+        L = LongDivision(v[0], v[1])
+        steps = "".join([Worksheets.DIV_STEP % t for t in L.steps])
+        return Worksheets.DIV_SOL % (L.quotient, L.divisor, L.dividend, steps)
+
+    @staticmethod
+    def DivStacks(v, solution):
+        """The long division of the values (D, d, q, r) for the pdf backend"""
+
+        L = LongDivision(v[0], v[1])
+        rows = [("", L.quotient if solution else ""), None,
+                ("%d )" % L.divisor, L.dividend)]
+        if (solution):
+            for p, r in L.steps:
+                rows += [("", p), None, ("", r)]
+        return [rows]
 
 
     #-----------------------------------------------------------
     #  Div1
     #
-    def Div1(self):
+    def Div1(self, rng):
         """Single-digit division"""
 
-        D = random.randint(1000,99999)
-        d = random.randint(2,9)
+        D = rng.randint(1000,99999)
+        d = rng.randint(2,9)
         q = D//d
         r = D % d
 
-        ans  = "{\\setlength\\tabcolsep{2pt} \\begin{tabular}{rcl}\n"
-        ans += " & & \\\\"
-        ans += " \\cline{2-3}\n"
-        ans += ("\\verb|%d| & ) & \\verb|%d|" % (d,D)) + "\\\\ \n"
-        ans += "\\end{tabular}}\n\\vspace{44mm}\n"
-
-        sol = "{\\small\\quad\\longdiv{%d}{%d}}\\vspace{3mm}\n" % (D,d)
-
-        return sol, ans
+        return D, d, q, r
 
 
     #-----------------------------------------------------------
     #  Divm
     #
-    def Divm(self):
+    def Divm(self, rng):
         """Multi-digit division"""
 
-        D = random.randint(1000,99999)
-        d = random.randint(10,999)
+        D = rng.randint(1000,99999)
+        d = rng.randint(10,999)
         q = D//d
         r = D % d
 
-        ans  = "{\\setlength\\tabcolsep{2pt} \\begin{tabular}{rcl}\n"
-        ans += " & & \\\\"
-        ans += " \\cline{2-3}\n"
-        ans += ("\\verb|%d| & ) & \\verb|%d|" % (d,D)) + "\\\\ \n"
-        ans += "\\end{tabular}}\n\\vspace{44mm}\n"
-
-        sol = "{\\small\\quad\\longdiv{%d}{%d}}\\vspace{3mm}\n" % (D,d)
-
-        return sol, ans
+        return D, d, q, r
 
 
     #-----------------------------------------------------------
     #  Frac1
     #
-    def Frac1(self):
+    FRAC1_ANS = "\\vspace{4mm}\n$\\displaystyle\\frac{%d}{%d} %s \\frac{%d}{%d}$\n\\vspace{6mm}\n"
+    FRAC1_SOL = "\\vspace{4mm}\n$\\displaystyle\\frac{%d}{%d} %s \\frac{%d}{%d} = %s$\n\\vspace{6mm}\n"
+
+    def Frac1(self, rng):
         """Single-digit fractions"""
-        
+
         z = [1,2,3,4,5,6,7,8,9]
-        random.shuffle(z)
+        rng.shuffle(z)
         A,C,_,_,_,_,_,_,_ = z
         z = [2,3,4,5,6,7,8,9]
-        random.shuffle(z)
+        rng.shuffle(z)
         B,D,_,_,_,_,_,_ = z
-        op = ["+","-","\\times","\\div"][random.randint(0,3)]
-
-        if (op == "+"):
-            f = Fraction(A,B) + Fraction(C,D)    
-        elif (op == "-"):
-            f = Fraction(A,B) - Fraction(C,D)    
-        elif (op == "\\times"):
-            f = Fraction(A,B) * Fraction(C,D)    
+        op = rng.randint(0,3)
+
+        #  the index Frac1Unrank would decode to these
+        ac = 8*(A-1) + C-1 - (C > A)
+        bd = 7*(B-2) + D-2 - (D > B)
+        return self.kind.table.values[4*(56*ac + bd) + op]
+
+    #  the operations, by code
+    FRAC1_OPS = ["+","-","\\times","\\div"]
+
+    def Frac1Unrank(self, items, rng):
+        """Frac1 from an index into the 72*56*4 distinct numerators,
+        denominators and operations"""
+
+        return self.kind.table.values[items[0]]
+
+    @staticmethod
+    def Frac1Table():
+        """The values of every Frac1 problem, by index"""
+
+        values = []
+        for k in range(72*56*4):
+            k, op = divmod(k, 4)
+            ac, bd = divmod(k, 56)
+            A, C = divmod(ac, 8)
+            A, C = A+1, C+1 + (C+1 >= A+1)      # C skips A
+            B, D = divmod(bd, 7)
+            B, D = B+2, D+2 + (D+2 >= B+2)      # D skips B
+            values.append(Worksheets.Frac1Values(A, B, op, C, D))
+        return values
+
+    @staticmethod
+    def Frac1Values(A, B, op, C, D):
+        """The values for A/B op C/D, op a code, and the answer E/F in lowest terms"""
+
+        if (op == 0):
+            E, F = A*D + C*B, B*D
+        elif (op == 1):
+            E, F = A*D - C*B, B*D
+        elif (op == 2):
+            E, F = A*C, B*D
         else:
-            f = Fraction(A,B) / Fraction(C,D)    
+            E, F = A*D, B*C
+        g = math.gcd(E, F)
 
-        E,F = f.numerator, f.denominator
+        return A, B, op, C, D, E//g, F//g
 
-        ans  = "\\vspace{4mm}\n"
-        ans += "$\\displaystyle\\frac{%d}{%d} %s \\frac{%d}{%d}$\n" % (A,B,op,C,D)
-        ans += "\\vspace{6mm}\n"
+    @staticmethod
+    def Frac1Problem(v):
+        """LaTeX for the values of Frac1"""
 
-        sol  = "\\vspace{4mm}\n"
-        if (E > 0):
-            if (F != 1):
-                sol += "$\\displaystyle\\frac{%d}{%d} %s \\frac{%d}{%d} = \\frac{%d}{%d}$\n" % (A,B,op,C,D,E,F)
-            else:
-                sol += "$\\displaystyle\\frac{%d}{%d} %s \\frac{%d}{%d} = %d$\n" % (A,B,op,C,D,E)
+        return Worksheets.FRAC1_ANS % (v[0], v[1], Worksheets.FRAC1_OPS[v[2]], v[3], v[4])
+
+    @staticmethod
+    def Frac1Solution(v):
+        """LaTeX for the values of Frac1, with the answer"""
+
+        A, B, op, C, D, E, F = v
+        if (F == 1):
+            rhs = "%d" % E
+        elif (E > 0):
+            rhs = "\\frac{%d}{%d}" % (E,F)
         else:
-            if (F != 1):
-                sol += "$\\displaystyle\\frac{%d}{%d} %s \\frac{%d}{%d} = -\\frac{%d}{%d}$\n" % (A,B,op,C,D,abs(E),F)
-            else:
-                sol += "$\\displaystyle\\frac{%d}{%d} %s \\frac{%d}{%d} = %d$\n" % (A,B,op,C,D,E)
-        sol += "\\vspace{6mm}\n"
+            rhs = "-\\frac{%d}{%d}" % (abs(E),F)
 
-        return sol, ans
+        return Worksheets.FRAC1_SOL % (A, B, Worksheets.FRAC1_OPS[op], C, D, rhs)
 
 
     #-----------------------------------------------------------
     #  Pow
     #
-    def Pow(self):
+    POW_ANS = "\\vspace{4mm}\n$\\displaystyle %d^{%d} %s %d^{%d}$\n\\vspace{6mm}\n"
+    POW_SOL = "\\vspace{4mm}\n$\\displaystyle %d^{%d} %s %d^{%d} = %d^{%d}$\n\\vspace{6mm}\n"
+
+    def Pow(self, rng):
         """Multiplication and division with powers"""
 
         B = [2,3,4,5,6,7,8,9]
-        random.shuffle(B)
+        rng.shuffle(B)
         B = B[0]
 
         a = [2,3,4,5,6,7,8,9]
-        random.shuffle(a)
+        rng.shuffle(a)
         s = [-1,1,1,1,1,1,1,1]
-        random.shuffle(s)
+        rng.shuffle(s)
         a = a[0] * s[0]
-        
+
         b = [2,3,4,5,6,7,8,9]
-        random.shuffle(b)
+        rng.shuffle(b)
         s = [-1,1]
-        random.shuffle(s)
+        rng.shuffle(s)
         b = b[0] * s[0]
 
-        op = ["\\times", "\\div"]
-        random.shuffle(op)
+        op = [0, 1]
+        rng.shuffle(op)
         op = op[0]
 
-        ans  = "\\vspace{4mm}\n"
-        ans += "$\\displaystyle %d^{%d} %s %d^{%d}$\n" % (B,a,op,B,b)
-        ans += "\\vspace{6mm}\n"
-
-        if (op == "\\times"):
+        #  the index PowUnrank would decode to these, and the signs
+        k = 2*(8*(8*(B-2) + abs(a)-2) + abs(b)-2) + op
+        return self.kind.table.values[4*k + 2*(a < 0) + (b < 0)]
+
+    #  the operations, by code
+    POW_OPS = ["\\times", "\\div"]
+
+    def PowUnrank(self, items, rng):
+        """Pow from an index into the 8*8*8*2 bases, exponent sizes and
+        operations, the signs of the exponents are still random"""
+
+        k, = items
+        sa = rng.randint(0,7) == 0
+        sb = rng.choice([-1,1]) < 0
+        return self.kind.table.values[4*k + 2*sa + sb]
+
+    @staticmethod
+    def PowTable():
+        """The values of every Pow problem, by index and then the signs
+        of the exponents"""
+
+        values = []
+        for k in range(8*8*8*2*4):
+            k, sb = divmod(k, 2)
+            k, sa = divmod(k, 2)
+            k, op = divmod(k, 2)
+            k, b = divmod(k, 8)
+            B, a = divmod(k, 8)
+            values.append(Worksheets.PowValues(B+2, (a+2)*(1-2*sa), op, (b+2)*(1-2*sb)))
+        return values
+
+    @staticmethod
+    def PowValues(B, a, op, b):
+        """The values for B^a op B^b, op a code, and the exponent c of the answer"""
+
+        if (op == 0):
             c = a+b
         else:
             c = a-b
 
-        sol  = "\\vspace{4mm}\n"
-        sol += "$\\displaystyle %d^{%d} %s %d^{%d} = %d^{%d}$\n" % (B,a,op,B,b,B,c)
-        sol += "\\vspace{6mm}\n"
+        return B, a, op, b, c
+
+    @staticmethod
+    def PowProblem(v):
+        """LaTeX for the values of Pow"""
+
+        return Worksheets.POW_ANS % (v[0], v[1], Worksheets.POW_OPS[v[2]], v[0], v[3])
 
-        return sol, ans
+    @staticmethod
+    def PowSolution(v):
+        """LaTeX for the values of Pow, with the answer"""
+
+        return Worksheets.POW_SOL % (v[0], v[1], Worksheets.POW_OPS[v[2]], v[0], v[3],
+                                     v[0], v[4])
 
 
     #-----------------------------------------------------------
     #  Pct1
     #
-    def Pct1(self):
+    PCT1_ANS = "\\vspace{2mm}\\verb|%d|\\%% of \\verb|%d|\n"
+    PCT1_SOL = "\\verb|%d|\\%% of \\verb|%d| is \\verb|%s|\n"
+    PCT1_LINE = "%d%% of %d is %s"
+
+    def Pct1(self, rng):
         """Percent of a number"""
 
-        p = random.randint(1,100)
-        n = random.randint(10,1000)
-        a = (p/100.0)*n
+        p = rng.randint(1,100)
+        n = rng.randint(10,1000)
+
+        #  the answer in hundredths
+        return p, n, p*n
 
-        ans = "\\vspace{2mm}\\verb|%d|\\%% of \\verb|%d|\n" % (p,n)
-        sol = "\\verb|%d|\\%% of \\verb|%d| is \\verb|%0.6f|\n" % (p,n,a)
+    @staticmethod
+    def Pct1Solution(v, fmt=PCT1_SOL):
+        """LaTeX for the values of Pct1, with the answer"""
 
-        return sol, ans
+        return fmt % (v[0], v[1], Fixed(v[2], 2, 6))
 
 
     #-----------------------------------------------------------
     #  Pct2
     #
-    def Pct2(self):
+    PCT2_ANS = "\\vspace{2mm}from \\verb|%d| to \\verb|%d|\n"
+    PCT2_SOL = "(\\verb|%d|-\\verb|%d|)/\\verb|%d| = \\verb|%s|\\%%\n"
+    PCT2_LINE = "(%d-%d)/%d = %s%%"
+
+    def Pct2(self, rng):
         """Percent change"""
 
-        A = random.randint(10,100)
-        if (random.random() < 0.5):
-            B = A - random.randint(1,A-1)
+        A = rng.randint(10,100)
+        if (rng.random() < 0.5):
+            B = A - rng.randint(1,A-1)
         else:
-            B = A + random.randint(1,A-1)
-        p = 100.0*(B-A)/A
+            B = A + rng.randint(1,A-1)
+
+        #  the answer in thousandths of a percent, rounded
+        return A, B, RoundDiv(100000*(B-A), A)
 
-        ans = "\\vspace{2mm}from \\verb|%d| to \\verb|%d|\n" % (A,B)
-        sol = "(\\verb|%d|-\\verb|%d|)/\\verb|%d| = \\verb|%0.3f|\\%%\n" % (B,A,A,p)
+    @staticmethod
+    def Pct2Solution(v, fmt=PCT2_SOL):
+        """LaTeX for the values of Pct2, with the answer"""
 
-        return sol, ans
+        return fmt % (v[1], v[0], v[0], Fixed(v[2], 3))
 
 
     #-----------------------------------------------------------
     #  Problem
     #
-    def Problem(self):
-        """Return a problem"""
-
-        #  this program grew organically, hence the lame nested-if structure
-        if (self.op == "add2"):
-            sol, ans = self.Add2()
-        elif (self.op == "add3"):
-            sol, ans = self.Add3()
-        elif (self.op == "add4"):
-            sol, ans = self.Add4()
-        elif (self.op == "addm"):
-            sol, ans = self.Addm()
-        elif (self.op == "subm"):
-            sol, ans = self.Subm()
-        elif (self.op == "sub"):
-            sol, ans = self.Sub()
-        elif (self.op == "subnb"):
-            sol, ans = self.SubNice()
-        elif (self.op == "mul1"):
-            sol, ans = self.Mul1()
-        elif (self.op == "mul2"):
-            sol, ans = self.Mul2()
-        elif (self.op == "mul3"):
-            sol, ans = self.Mul3()
-        elif (self.op == "muls"):
-            sol, ans = self.Muls()
-        elif (self.op[:2] == "md"):
-            sol, ans = self.Md(int(self.op[-1]))
-        elif (self.op == "div1"):
-            sol, ans = self.Div1()
-        elif (self.op == "divm"):
-            sol, ans = self.Divm()
-        elif (self.op == "frac1"):
-            sol, ans = self.Frac1()
-        elif (self.op == "pow"):
-            sol, ans = self.Pow()
-        elif (self.op == "dmult"):
-            sol, ans = self.Dmult()
-        elif (self.op == "pct1"):
-            sol, ans = self.Pct1()
-        elif (self.op == "pct2"):
-            sol, ans = self.Pct2()
-        else:
-            raise ValueError("Not implemented")
+    def Problem(self, rng, rows=None):
+        """Return a problem, formatting the next precomputed row if given rows"""
 
-        return sol, ans
+        values = self.generate(rng) if (rows is None) else next(rows)
+        return self.kind.solution(values), self.kind.problem(values)
 
 
     #-----------------------------------------------------------
-    #  BuildPage
+    #  PerPage
     #
-    def BuildPage(self):
-        """Build a page for the given op"""
+    def PerPage(self):
+        """Rows of four problems on a page"""
 
-        sols = []
+        if (self.fit):
+            return self.Fit()[0]
+        return self.kind.rows
 
-        header = "\\begin{tabular}{|>{\\centering\\arraybackslash}p{4cm}|>{\\centering\\arraybackslash}p{4cm}|>{\\centering\\arraybackslash}p{4cm}|>{\\centering\\arraybackslash}p{4cm}|}"
-        top = "\\hline"
-        bot = "\\\\ \\hline\n" 
 
-        if (self.op in ["mul1","md2","md3","md4","md5","md6","md7","md8","md9"]):
-            header = "\\begin{tabular}{>{\\centering\\arraybackslash}p{4cm}>{\\centering\\arraybackslash}p{4cm}>{\\centering\\arraybackslash}p{4cm}>{\\centering\\arraybackslash}p{4cm}}"
-            top = ""
+    #-----------------------------------------------------------
+    #  Fit
+    #
+    #  With fit, the rows are as many as the heights of the problem
+    #  type allow within the page, the same for both documents so that
+    #  they line up, and the spacing in the templates gives way to the
+    #  page's height shared out between the rows.  The heights are the tallest of a sample of problems and
+    #  their solutions, the LaTeX worked out by TexHeight, the pdf
+    #  backend's from the stacks it draws.
+    #
+    TEXT_HEIGHT = 279.4 - 15 - 20   # mm, letter paper less the margins
+    PAD = 4                         # mm above each problem
+    GAP = 2                         # mm below the taller of the two, at least
+    TEX_ROW = 2                     # mm a row adds, its last strut and rule
+    TEX_TOP = 5                     # mm the center environment takes
+    SAMPLE = 256                    # problems measured
+    VSPACE = re.compile(r"\\vspace\{[0-9.]+mm\}\n?")
+
+    def Fit(self):
+        """Rows on a page, the height of a row's cells and the space above
+        each problem, in mm, and the heights of the tallest solution and
+        problem"""
+
+        if (self.layout is None):
+            if (self.backend == "pdf"):
+                boxes, extra, height = (self.StackBox(),)*2, 0, self.TEXT_HEIGHT
+            else:
+                boxes, extra = self.TexBoxes(), self.TEX_ROW
+                height = self.TEXT_HEIGHT - self.TEX_TOP
+            box = max(boxes)
+            rows = max(1, int(height // (box + self.PAD + self.GAP + extra)))
+            cell = height/rows - extra
+            self.layout = rows, cell, max(0, min(self.PAD, cell - box)), boxes
+        return self.layout
+
+    def Sample(self):
+        """The problems heights are measured on, the same every time"""
+
+        generate = functools.partial(self.kind.generator, self, *self.kind.args)
+        rng = random.Random(0)
+        return [generate(rng) for i in range(self.SAMPLE)]
+
+    def TexBoxes(self):
+        """The tallest the solutions and the problems come out in LaTeX, in mm"""
+
+        strip = self.VSPACE.sub
+        values = self.Sample()
+        return tuple(TEX_PT*max(TexHeight(strip("", render(v))) for v in values)
+                     for render in (self.kind.solution, self.kind.problem))
+
+    def StackBox(self):
+        """The tallest the pdf backend draws a problem or solution, in mm"""
+
+        box = 0
+        for v in self.Sample():
+            for solution in (True, False):
+                stacks = self.kind.stacks(v, solution)
+                if (len(stacks) == 1):
+                    box = max(box, StackSize(stacks[0], 40*pdf.MM)[2])
+                else:
+                    #  two by two, the second pair half a row down
+                    h = max(StackSize(st, 20*pdf.MM)[2] for st in stacks)
+                    box = max(box, 2*h + self.GAP*pdf.MM)
+        return box / pdf.MM
+
+    def FitCell(self, render, box):
+        """render with the spacing in its template swapped for the page's,
+        box the tallest it comes out"""
+
+        rows, cell, pad, boxes = self.Fit()
+        head = "\\vspace{%0.2fmm}\n" % pad
+        tail = "\\vspace{%0.2fmm}\n" % max(0, cell - pad - box)
+        strip = self.VSPACE.sub
+        return lambda v: head + strip("", render(v)) + tail
+
+
+    #-----------------------------------------------------------
+    #  BuildPage
+    #
+    CELL = ">{\\centering\\arraybackslash}p{4cm}"
+    RULED = "\\begin{center}\n\\begin{tabular}{|%s|%s|%s|%s|}\n\\hline\n" % ((CELL,)*4)
+    PLAIN = "\\begin{center}\n\\begin{tabular}{%s%s%s%s}\n\n" % ((CELL,)*4)
+    END = "\\end{tabular}\n\\end{center}\n"
+
+    def PageValues(self, rng, rows=None, page=None):
+        """The values of every problem on a page"""
+
+        n = 4*self.PerPage()
+        if (self.bank is not None):
+            #  a stride through the bank, no repeats until it is used up
+            first, step, size = page*n, self.stride, len(self.bank)
+            return [self.bank[(self.start + (first+i)*step) % size] for i in range(n)]
+        if (page is not None) and (self.Indexed()):
+            #  walk the problem space without replacement
+            per = self.kind.per
+            items = self.Items(page*n*per, n*per)
+            return [self.unrank(items[i:i+per], rng) for i in range(0, n*per, per)]
+        if (rows is None):
+            return [self.generate(rng) for i in range(n)]
+        return [next(rows) for i in range(n)]
+
+    def BuildPage(self, rng, rows=None, page=None, want=(True, True)):
+        """Build a page for the given op.
+
+        Returns the (solution, problem) pages; want says which to
+        render, the other is None and none of its text is formatted.
+        """
+
+        values = self.PageValues(rng, rows, page)
+        if (self.backend == "pdf"):
+            return self.PdfPage(values, want)
+
+        head = self.RULED
+        bot = "\\\\ \\hline\n"
+        if (not self.kind.ruled):
+            head = self.PLAIN
             bot = "\\\\ \n"
-        
-        ans = "\n".join([
-            "\\begin{center}", header, top])+"\n"
-
-        #  fit more problems per page
-        M = 4
-        if (self.op == "frac1") or (self.op == "pow"):
-            M = 10
-        if (self.op == "pct1") or (self.op == "pct2"):
-            M = 20
-        
-        for i in range(M):
-            sol, t = self.Problem()
-            sols.append(sol)
-            ans += t + "&\n" 
-            sol, t = self.Problem()
-            sols.append(sol)
-            ans += t + "&\n" 
-            sol, t = self.Problem()
-            sols.append(sol)
-            ans += t + "&\n" 
-            sol, t = self.Problem()
-            sols.append(sol)
-            ans += t + bot
-        ans += "\\end{tabular}\n\\end{center}\n"
-
-        soln = "\n".join([
-            "\\begin{center}", header, top])+"\n"
-        k = 0
-        for i in range(M):
-            soln += sols[k] + "&\n"; k += 1 
-            soln += sols[k] + "&\n"; k += 1 
-            soln += sols[k] + "&\n"; k += 1 
-            soln += sols[k] + bot; k += 1 
-        soln += "\\end{tabular}\n\\end{center}\n"
-
-        return soln, ans
+        seps = ["&\n", "&\n", "&\n", bot] * self.PerPage()
+
+        #  collect the fragments, join once at the end
+        pages = []
+        renders = (self.kind.solution, self.kind.problem)
+        for k, (render, wanted) in enumerate(zip(renders, want)):
+            if (not wanted):
+                pages.append(None)
+                continue
+            if (self.fit):
+                render = self.FitCell(render, self.Fit()[3][k])
+            out = [head]
+            for v, sep in zip(values, seps):
+                out += (render(v), sep)
+            out.append(self.END)
+            pages.append("".join(out))
+
+        return pages[0], pages[1]
+
+
+    #-----------------------------------------------------------
+    #  PdfPage
+    #
+    def PdfPage(self, values, want=(True, True)):
+        """Content streams of a page for the pdf backend"""
+
+        W, H = pdf.LETTER
+        left, top, bottom = 20*pdf.MM, H - 15*pdf.MM, 20*pdf.MM
+        colw = 40*pdf.MM
+        M = self.PerPage()
+        rowh = (top - bottom) / M
+        #  the space above each stack and the least below it; a stack
+        #  too deep for its row is drawn smaller
+        pad, gap = 4*pdf.MM, 1*pdf.MM
+
+        grid = ""
+        if (self.kind.ruled):
+            for r in range(M+1):
+                grid += pdf.Line(left, top - r*rowh, left + 4*colw, top - r*rowh)
+            for c in range(5):
+                grid += pdf.Line(left + c*colw, top, left + c*colw, top - M*rowh)
+
+        pages = []
+        for solution, wanted in zip([True, False], want):
+            if (not wanted):
+                pages.append(None)
+                continue
+            out = [grid]
+            for k, v in enumerate(values):
+                x, y = left + (k % 4)*colw, top - (k // 4)*rowh
+                stacks = self.kind.stacks(v, solution)
+                if (len(stacks) == 1):
+                    out.append(DrawStack(stacks[0], x + colw/2, y - pad, colw,
+                                         depth=rowh - pad - gap))
+                else:
+                    #  two by two
+                    for j, st in enumerate(stacks):
+                        out.append(DrawStack(st, x + colw/4 + (j % 2)*colw/2,
+                                             y - pad - (j // 2)*rowh/2, colw/2,
+                                             depth=rowh/2 - pad - gap))
+            pages.append("".join(out))
+        return pages[0], pages[1]
+
+
+    #-----------------------------------------------------------
+    #  Items
+    #
+    def Indexed(self):
+        """True if problems are drawn from the indexed problem space"""
+
+        return (self.distinct) and (self.kind.space is not None)
+
+    def Permutation(self, cycle):
+        """The order the problem space is visited in, on the given pass.
+
+        Each pass through the space has its own order, derived from the
+        seed, so any page can find its items without the pages before it.
+        """
+
+        if (self.perm is None) or (self.perm[0] != cycle):
+            order = list(range(self.kind.space))
+            random.Random(self.SubSeed("space/%d" % cycle)).shuffle(order)
+            self.perm = (cycle, order)
+        return self.perm[1]
+
+    def Items(self, first, n):
+        """Indices into the problem space for draws first to first+n-1.
+
+        No index repeats until the whole space has been used, then the
+        next pass starts in a new order.
+        """
+
+        space = self.kind.space
+        items = []
+        while (len(items) < n):
+            cycle, j = divmod(first + len(items), space)
+            items += self.Permutation(cycle)[j:j + n - len(items)]
+        return items
+
+
+    #-----------------------------------------------------------
+    #  SubSeed
+    #
+    def SubSeed(self, name):
+        """A seed for one part of the document, derived from the seed"""
+
+        h = hashlib.sha256(("%d/%s" % (self.seed, name)).encode("ascii"))
+        return int.from_bytes(h.digest()[:8], "big")
+
+
+    #-----------------------------------------------------------
+    #  PageRng
+    #
+    def PageRng(self, page):
+        """Independent generator for one page, derived from the seed"""
+
+        return random.Random(self.SubSeed(page))
+
+
+    #-----------------------------------------------------------
+    #  Batches
+    #
+    #  pages produced at a time
+    WINDOW = 256
+
+    def Batched(self):
+        """True if operands are drawn a window of pages at a time"""
+
+        return (self.batched) and (self.op in Operands.OPS) and (not self.Indexed()) \
+               and (self.bank is None)
+
+    def Batches(self):
+        """The rows of values for each window of pages, and its page count"""
+
+        for w in range(0, self.pages, self.WINDOW):
+            n = min(self.WINDOW, self.pages - w)
+            seed = self.SubSeed("batch/%d" % (w // self.WINDOW))
+            yield Operands(self.op, 4*self.PerPage()*n, seed).Rows(), n
+
+
+    #-----------------------------------------------------------
+    #  Values
+    #
+    def Values(self):
+        """The values of each page, in order, the same problems Pages lays out"""
+
+        for ws in self.Sheets():
+            if (self.Batched()):
+                for rows, n in ws.Batches():
+                    for i in range(n):
+                        yield ws.PageValues(None, rows)
+                continue
+            for i in range(self.pages):
+                yield ws.PageValues(ws.PageRng(i), page=i)
+
+
+    #-----------------------------------------------------------
+    #  UseBank
+    #
+    def UseBank(self, bank):
+        """Draw problems from bank, a Pool, instead of generating them.
+
+        Page p takes the problems at start + k*stride, modulo the bank
+        size, for its positions k; the start and the stride, prime to the
+        size, come from the seed.
+        """
+
+        if (bank.kind is not self.kind):
+            raise ValueError("The bank holds %s problems, not %s" % (bank.kind.name, self.op))
+        if (len(bank) == 0):
+            raise ValueError("The bank is empty")
+        size = len(bank)
+        rng = random.Random(self.SubSeed("bank"))
+        self.start = rng.randrange(size)
+        self.stride = rng.randrange(1, size) if (size > 1) else 1
+        while (math.gcd(self.stride, size) != 1):
+            self.stride += 1
+        self.bank = bank
+
+
+    #-----------------------------------------------------------
+    #  Students
+    #
+    def Sheets(self):
+        """The worksheets the documents are made of: this one, or for a
+        class set one per student, each with a seed derived from this one"""
+
+        if (self.students is None):
+            return [self]
+        if (self.variants is None):
+            self.variants = [self.Variant(self.SubSeed("student/%d" % k))
+                             for k in range(len(self.students))]
+        return self.variants
+
+    def Variant(self, seed):
+        """The same worksheet, for one student, with another seed"""
+
+        ws = copy.copy(self)             # through __getstate__, as for a worker
+        ws.seed = seed
+        ws.students = ws.variants = None
+        ws.Profiled(self.profile)
+        if (self.bank is not None):
+            ws.UseBank(self.bank)
+        return ws
+
+    def Id(self, k):
+        """Student k's ID, numbered from 1, as wide as the largest"""
+
+        return "%0*d" % (len("%d" % len(self.students)), k+1)
+
+    def Title(self, k):
+        """Student k's bookmark"""
+
+        return self.students[k] or "Student %s" % self.Id(k)
+
+    #  where each student's pages start
+    DESTS = {"problems": "student-%d", "solutions": "key-%d"}
+
+    def Head(self, k, part, tex=True):
+        """The line heading each page of student k's worksheet or answer key,
+        in plain ASCII since the preamble's OT1 fonts have no accented letters"""
+
+        if (part == "solutions"):
+            title = TexEscape(Plain(self.Title(k))) if tex else Plain(self.Title(k))
+            return "Answer key: %s, ID %s, seed %d" % (title, self.Id(k), self.Sheets()[k].seed)
+        if (tex):
+            return "Name: %s\\quad ID %s" % (TexEscape(Plain(self.students[k])) or
+                                            "\\underline{\\hspace{6cm}}", self.Id(k))
+        return "Name: %s   ID %s" % (Plain(self.students[k]) or "_"*24, self.Id(k))
+
+    def Header(self, k, part):
+        """LaTeX starting student k's pages: the head on each page, page
+        numbers from 1, a named destination and a bookmark"""
+
+        dest = self.DESTS[part] % (k+1)
+        title = "".join(c for c in Plain(self.Title(k)) if c.isalnum() or c in " .,'-")
+        return ("\\setcounter{page}{1}\\pagestyle{myheadings}\\markright{%s}\n"
+                "\\pdfdest name{%s} xyz\\pdfoutline goto name{%s} {%s}\n" % (
+                self.Head(k, part), dest, dest, title))
+
+    def PdfHeader(self, k, part):
+        """Content stream operators for the head of student k's pages"""
+
+        return pdf.Text(20*pdf.MM, pdf.LETTER[1] - 10*pdf.MM, self.Head(k, part, False), 10, "F2")
+
+    def SplitStudents(self, results):
+        """Copy each student's pages of each document to a file of its own,
+        <output>_<id>_problems.pdf and _solutions.pdf"""
+
+        if (not self.split) or (not results) or (not all(r.ok for r in results)):
+            return results
+        try:
+            for part in self.parts:
+                with open(self.output+"_%s.pdf" % part, "rb") as f:
+                    reader = pdf.PdfReader(f.read())
+                n = len(reader.pages)
+                first = [reader.Dest(self.DESTS[part] % (k+1)) for k in range(len(self.students))]
+                first = [k*self.pages if (p is None) else p for k, p in enumerate(first)] + [n]
+                with self.Span("students"):
+                    for k in range(len(self.students)):
+                        with open(self.output+"_%s_%s.pdf" % (self.Id(k), part), "wb") as f:
+                            pdf.Extract(reader, range(first[k], first[k+1]), f)
+        except (OSError, ValueError, KeyError, IndexError, zlib.error) as e:
+            results[-1].returncode = None
+            results[-1].log += "\ncould not split per student: %s\n" % e
+        return results
+
+
+    #-----------------------------------------------------------
+    #  Draw
+    #
+    def Draw(self):
+        """Every problem of the document, as a Pool"""
+
+        pool = Pool(self.kind)
+        for values in self.Values():
+            for v in values:
+                pool.Append(v)
+        return pool
+
+
+    #-----------------------------------------------------------
+    #  Export
+    #
+    def Export(self, f, format="jsonl"):
+        """Stream every problem of the document to text file f as JSON
+        lines or CSV records: operator, operands, answer and any steps.
+        No LaTeX is made.  Returns the number of records.
+        """
+
+        record = self.kind.record
+        encode = json.JSONEncoder(default=str, separators=(",", ":")).encode
+        if (format == "csv"):
+            out = csv.writer(f)
+            out.writerow(["op", "id", "page", "operator", "operands", "answer", "steps"])
+        elif (format != "jsonl"):
+            raise ValueError("Unknown export format: %s" % format)
+
+        n = 0
+        for page, values in enumerate(self.Values()):
+            records = []
+            for v in values:
+                for r in record(v):
+                    if (format == "csv"):
+                        records.append([self.op, n, page, r["operator"],
+                                        " ".join(map(str, r["operands"])), r["answer"],
+                                        encode(r["steps"]) if ("steps" in r) else ""])
+                    else:
+                        records.append(dict(op=self.op, id=n, page=page, **r))
+                    n += 1
+            if (format == "csv"):
+                out.writerows(records)
+            else:
+                f.write("".join(encode(r) + "\n" for r in records))
+        return n
+
+
+    #-----------------------------------------------------------
+    #  Pages
+    #
+    def Pages(self, want=(True, True)):
+        """Build every page, in order, over self.jobs processes if more than one.
+
+        Pages are produced a window at a time so that memory use does not
+        grow with the page count.
+        """
+
+        window = self.WINDOW
+        sheets = self.Sheets()
+
+        if (self.Batched()):
+            #  draw a window of pages at once, pages only format
+            for ws in sheets:
+                for rows, n in ws.Batches():
+                    for i in range(n):
+                        yield ws.BuildPage(None, rows, want=want)
+            return
+
+        total = self.pages * len(sheets)
+        if (self.jobs <= 1) or (total < 2):
+            for ws in sheets:
+                for i in range(self.pages):
+                    yield ws.BuildPage(ws.PageRng(i), page=i, want=want)
+            return
+
+        #  each worker gets the worksheets once, pages are sent by number
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_InitWorker,
+                                 initargs=(sheets,)) as pool:
+            window = max(window, 4*self.jobs)
+            for w in range(0, total, window):
+                pages = range(w, min(w+window, total))
+                chunk = max(1, len(pages) // (4*self.jobs))
+                yield from pool.map(_BuildPage, [i // self.pages for i in pages],
+                                    [i % self.pages for i in pages],
+                                    [want]*len(pages), chunksize=chunk)
+
+
+    #-----------------------------------------------------------
+    #  Write
+    #
+    def Write(self, problems=None, solutions=None):
+        """Stream the documents to file-like objects, page by page.
+
+        Either may be None to skip that document.  Nothing is kept once
+        a page has been written.  The sinks are text files for the latex
+        backend and binary files for the pdf backend.
+        """
+
+        want = (solutions is not None, problems is not None)
+        parts = ("solutions", "problems")
+        if (self.backend == "pdf"):
+            writers = [pdf.PdfWriter(f) if (f is not None) else None
+                       for f in (solutions, problems)]
+            for i, page in enumerate(self.Pages(want)):
+                k, j = divmod(i, self.pages)
+                for w, part, content in zip(writers, parts, page):
+                    if (w is not None):
+                        if (self.students is not None):
+                            if (j == 0):
+                                w.Outline(self.Title(k))
+                            content = self.PdfHeader(k, part) + content
+                        w.Page(content)
+            for w in writers:
+                if (w is not None):
+                    w.Close()
+            return
+
+        sinks = [f for f in (solutions, problems) if f is not None]
+        for f in sinks:
+            f.write(self.Prelude())
+
+        for i, page in enumerate(self.Pages(want)):
+            k, j = divmod(i, self.pages)
+            for f, part, text in zip((solutions, problems), parts, page):
+                if (f is not None):
+                    if (i > 0):
+                        f.write("\\newpage\n")
+                    if (j == 0) and (self.students is not None):
+                        f.write(self.Header(k, part))
+                    f.write(text)
+
+        for f in sinks:
+            f.write(self.Postlude())
+
+
+    #-----------------------------------------------------------
+    #  WriteSingle
+    #
+    #  between the problems and the solutions of a combined document,
+    #  the named destination marks where to split it
+    SPLIT = "\\clearpage\n\\setcounter{page}{1}\n\\pdfdest name{solutions} xyz\n"
+
+    def WriteSingle(self, f):
+        """Stream one document, the problem pages then the solution pages.
+
+        The solution pages are spooled to a temporary file until the
+        problems are done.
+        """
+
+        with tempfile.TemporaryFile("w+") as s:
+            f.write(self.Prelude())
+            for i, (solution, problem) in enumerate(self.Pages()):
+                k, j = divmod(i, self.pages)
+                if (i > 0):
+                    f.write("\\newpage\n")
+                    s.write("\\newpage\n")
+                if (j == 0) and (self.students is not None):
+                    f.write(self.Header(k, "problems"))
+                    s.write(self.Header(k, "solutions"))
+                f.write(problem)
+                s.write(solution)
+            f.write(self.SPLIT)
+            s.seek(0)
+            shutil.copyfileobj(s, f)
+            f.write(self.Postlude())
+
+
+    #-----------------------------------------------------------
+    #  SplitPdf
+    #
+    def SplitPdf(self, result):
+        """Split the combined PDF into the problems and solutions PDFs"""
+
+        start = time.perf_counter()
+        try:
+            with open(result.pdf, "rb") as f:
+                reader = pdf.PdfReader(f.read())
+            n = len(reader.pages)
+            k = reader.Dest("solutions")
+            if (k is None):
+                k = n // 2
+            outlines = {"problems": [], "solutions": []}
+            for s in range(len(self.students or ())):
+                for part, offset in [("problems", 0), ("solutions", k)]:
+                    p = reader.Dest(self.DESTS[part] % (s+1))
+                    if (p is not None):
+                        outlines[part].append((self.Title(s), p - offset))
+            with open(self.output+"_problems.pdf","wb") as a, \
+                 open(self.output+"_solutions.pdf","wb") as s:
+                pdf.Extract(reader, range(0, k), a, outlines["problems"])
+                pdf.Extract(reader, range(k, n), s, outlines["solutions"])
+        except (ValueError, KeyError, IndexError, zlib.error) as e:
+            result.returncode = None
+            result.log += "\ncould not split %s: %s\n" % (result.pdf, e)
+        else:
+            os.remove(result.pdf)
+            result.pdf = self.output+"_problems.pdf"
+        result.elapsed += time.perf_counter() - start
+        return result
 
 
     #-----------------------------------------------------------
@@ -778,39 +2171,777 @@ class Worksheets:
     def Create(self):
         """Do it"""
 
-        #  Build the document
-        self.ans = self.Prelude()
-        self.soln= self.Prelude()
+        if (self.profile is None):
+            return self.SplitStudents(self.Build())
+
+        self.profile.Start()
+        try:
+            with self.profile.Span("create"):
+                results = self.SplitStudents(self.Build())
+        finally:
+            self.profile.Stop()
+        return results
+
+    def Span(self, name):
+        """A profile span, or nothing if not profiling"""
 
-        for i in range(self.pages):
-            soln, ans = self.BuildPage()
-            self.ans += ans
-            self.soln += soln
-            if (i < (self.pages-1)):
-                self.ans += "\\newpage\n"
-                self.soln += "\\newpage\n"
+        if (self.profile is None):
+            return contextlib.nullcontext()
+        return self.profile.Span(name)
+
+    def Compiled(self, results):
+        """Note each pdflatex run in the profile"""
+
+        if (self.profile is not None):
+            now = time.perf_counter()
+            for r in results:
+                name = "cached" if r.cached else "pdflatex"
+                self.profile.Add(name, now - r.elapsed, r.elapsed)
+        return results
+
+
+    #-----------------------------------------------------------
+    #  Build
+    #
+    def Build(self):
+        """Write the documents and compile them"""
+
+        if (self.backend == "pdf"):
+            #  straight to PDF, no TeX involved
+            start = time.perf_counter()
+            with contextlib.ExitStack() as files, self.Span("write"):
+                f = {part: files.enter_context(open(self.output+"_%s.pdf" % part, "wb"))
+                     for part in self.parts}
+                self.Write(f.get("problems"), f.get("solutions"))
+            elapsed = time.perf_counter() - start
+            return [CompileResult(None, 0, elapsed, "", pdf=self.output+"_%s.pdf" % part)
+                    for part in self.parts]
+
+        #  Reuse the precompiled preamble if asked to
+        self.format = None
+        if (self.fmt):
+            with self.Span("format"):
+                self.format = PreambleFormat(self.timeout, self.fit)
+
+        if (self.single):
+            #  one document, one pdflatex run, then split
+            with open(self.output+".tex","w") as f, self.Span("write"):
+                self.WriteSingle(f)
+            if (not self.compile):
+                return []
+            with self.Span("compile"):
+                r = CompileCached(self.output+".tex", self.timeout, self.format, self.cache)
+            self.Compiled([r])
+            with self.Span("split"):
+                return [self.SplitPdf(r) if r.ok else r]
+
+        #  Write the documents
+        texs = [self.output+"_%s.tex" % part for part in self.parts]
+        with contextlib.ExitStack() as files, self.Span("write"):
+            f = {part: files.enter_context(open(tex, "w"))
+                 for part, tex in zip(self.parts, texs)}
+            self.Write(f.get("problems"), f.get("solutions"))
+
+        if (not self.compile):
+            return []
+
+        # LaTeX it, both documents at once
+        with self.Span("compile"):
+            results = Compile(texs, self.timeout, self.format, self.cache)
+        return self.Compiled(results)
 
-        self.ans += self.Postlude()
-        self.soln += self.Postlude()
 
-        # LaTeX it
-        with open(self.output+"_problems.tex","w") as f:
-            f.write(self.ans)
-        os.system("pdflatex %s_problems.tex" % self.output)
-        with open(self.output+"_solutions.tex","w") as f:
-            f.write(self.soln)
-        os.system("pdflatex %s_solutions.tex" % self.output)
+    #-----------------------------------------------------------
+    #  Bind
+    #
+    def Bind(self):
+        """Look up the problem type, once, rather than per problem"""
+
+        if (self.op not in PROBLEMS):
+            raise ValueError("Not implemented: %s" % self.op)
+        self.kind = PROBLEMS[self.op]
+        if (self.kind.table is not None):
+            self.kind.table.Build()
+        self.generate = functools.partial(self.kind.generator, self, *self.kind.args)
+        self.unrank = None
+        if (self.kind.unrank is not None):
+            self.unrank = functools.partial(self.kind.unrank, self, *self.kind.args)
+
+    def Profiled(self, profile):
+        """Time the hot paths, only when asked to"""
+
+        self.profile = profile
+        if (profile is not None):
+            self.generate = profile.Wrap("problem", self.generate)
+            if (self.unrank is not None):
+                self.unrank = profile.Wrap("problem", self.unrank)
+            self.BuildPage = profile.Wrap("page", self.BuildPage)
+
+    def __getstate__(self):
+        """Worker processes look the problem type up again by name"""
+
+        state = dict(self.__dict__)
+        del state["kind"], state["generate"], state["unrank"]
+        state.pop("BuildPage", None)     # profiled, workers are not
+        state["perm"] = None
+        state["profile"] = None
+        state["variants"] = None
+        if (self.bank is not None) and (self.bank.source is not None):
+            state["bank"] = self.bank.source    # each worker maps it again
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.Bind()
+        if (isinstance(self.bank, str)):
+            #  mapped once per process, however many worksheets share it
+            if (self.bank not in _banks):
+                _banks[self.bank] = Pool.Map(self.bank)
+            self.bank = _banks[self.bank]
 
 
     #-----------------------------------------------------------
     #  __init__
     #
-    def __init__(self, op, pages, output):
+    def __init__(self, op, pages, output, timeout=COMPILE_TIMEOUT, fmt=False,
+                 cache=None, seed=None, jobs=1, batched=False, compile=True,
+                 backend="latex", single=False, distinct=True, profile=None,
+                 parts=("problems", "solutions"), bank=None, students=None,
+                 split=False, fit=False):
         """Constructor"""
 
         self.op = op
+        self.Bind()
+        if (backend not in ["latex", "pdf"]):
+            raise ValueError("Unknown backend: %s" % backend)
+        if (backend == "pdf") and (self.kind.stacks is None):
+            raise ValueError("The pdf backend cannot draw %s" % op)
+        self.backend = backend
         self.pages = pages
         self.output = output
+        self.timeout = timeout
+        self.fmt = fmt
+        self.format = None
+        self.cache = cache
+        self.jobs = jobs
+        self.batched = batched
+        self.compile = compile
+        self.single = single
+        self.parts = tuple(parts)
+        if (not set(self.parts) <= {"problems", "solutions"}) or (not self.parts):
+            raise ValueError("Unknown parts: %s" % ", ".join(self.parts))
+        if (single) and (len(self.parts) < 2):
+            raise ValueError("A single compile makes both problems and solutions")
+        self.distinct = distinct
+        self.perm = None
+        self.fit = fit
+        self.layout = None
+
+        self.Profiled(profile)
+
+        #  the same seed always gives the same worksheet
+        if (seed is None):
+            seed = int(binascii.hexlify(os.urandom(4)),16)
+        self.seed = seed
+
+        #  draw from a saved problem bank instead of generating
+        self.bank = None
+        if (bank is not None):
+            self.UseBank(Pool.Map(bank) if isinstance(bank, str) else bank)
+
+        #  a class set: students is a count or a list of names
+        if (isinstance(students, int)):
+            students = [""] * students
+        self.students = None if (students is None) else list(students)
+        if (self.students is not None) and (not self.students):
+            raise ValueError("A class set needs at least one student")
+        if (split) and (self.students is None):
+            raise ValueError("Only a class set can be split per student")
+        self.split = split
+        self.variants = None
+
+
+################################################################
+#  Pool
+#
+class Pool:
+    """Many problems of one kind kept as numbers only, width values per
+    problem packed in one array, 8 bytes each.  Text is rendered only
+    when asked for.
+
+    Values must be integers, or floats in columns that hold them, the
+    way the generators return them.
+    """
+
+    __slots__ = ("kind", "width", "floats", "data", "seed", "source")
+
+    #  a saved pool: magic, op, typecode, width, count, seed, float
+    #  columns as a bit mask, padded to 64 bytes so the values align,
+    #  then the values as little-endian int64 or double
+    MAGIC = b"WSBANK1\n"
+    HEADER = struct.Struct("<8s16scxHQQQ")
+    SIZE = 64
+
+    def __init__(self, kind, problems=()):
+        """Constructor"""
+
+        self.kind = kind
+        self.width = 0
+        self.floats = ()
+        self.data = None
+        self.seed = 0
+        self.source = None
+        for v in problems:
+            self.Append(v)
+
+    def Append(self, v):
+        """Add the values of one problem"""
+
+        if (self.data is None):
+            self.width = len(v)
+            self.floats = tuple(i for i, x in enumerate(v) if isinstance(x, float))
+            self.data = array.array("d" if self.floats else "q")
+        if (len(v) != self.width):
+            raise ValueError("%s values have %d fields, not %d" % (self.kind.name,
+                             self.width, len(v)))
+        for x in v:
+            if (not isinstance(x, (int, float))):
+                raise TypeError("Cannot pool %r" % (x,))
+        self.data.extend(v)
+
+    def __len__(self):
+        return 0 if (self.data is None) else len(self.data) // self.width
+
+    def __getitem__(self, i):
+        """The values of problem i, as the generator returned them"""
+
+        if (i < 0):
+            i += len(self)
+        if (not 0 <= i < len(self)):
+            raise IndexError("Pool index out of range")
+        v = self.data[i*self.width:(i+1)*self.width]
+        if (self.floats):
+            return tuple(x if (k in self.floats) else int(x) for k, x in enumerate(v))
+        return tuple(v)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def Problem(self, i):
+        """LaTeX for problem i"""
+
+        return self.kind.problem(self[i])
+
+    def Solution(self, i):
+        """LaTeX for problem i, worked"""
+
+        return self.kind.solution(self[i])
+
+    def Records(self, i):
+        """Export records for problem i"""
+
+        return self.kind.record(self[i])
+
+    def Save(self, f):
+        """Write the pool to binary file f, see Map"""
+
+        if (self.data is None):
+            raise ValueError("Nothing to save")
+        data = self.data
+        if (sys.byteorder == "big"):
+            data = array.array(data.typecode, data)
+            data.byteswap()
+        f.write(self.HEADER.pack(self.MAGIC, self.kind.name.encode("ascii"),
+                                 data.typecode.encode("ascii"), self.width,
+                                 len(self), self.seed,
+                                 sum(1 << k for k in self.floats)).ljust(self.SIZE, b"\0"))
+        data.tofile(f)
+
+    @classmethod
+    def Map(cls, fname):
+        """A saved pool, memory-mapped read only.
+
+        Nothing is read until a problem is used, and processes mapping
+        the same file share it in the page cache.
+        """
+
+        if (sys.byteorder == "big"):
+            raise ValueError("Problem banks need a little-endian machine")
+        with open(fname, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if (len(mm) < cls.SIZE):
+            raise ValueError("%s is not a problem bank" % fname)
+        magic, op, typecode, width, count, seed, floats = cls.HEADER.unpack_from(mm)
+        op = op.rstrip(b"\0").decode("ascii")
+        if (magic != cls.MAGIC):
+            raise ValueError("%s is not a problem bank" % fname)
+        if (op not in PROBLEMS):
+            raise ValueError("%s: unknown op %s" % (fname, op))
+        if (len(mm) != cls.SIZE + 8*width*count):
+            raise ValueError("%s: truncated" % fname)
+        pool = cls(PROBLEMS[op])
+        pool.width = width
+        pool.floats = tuple(k for k in range(width) if (floats >> k) & 1)
+        pool.data = memoryview(mm)[cls.SIZE:].cast(typecode.decode("ascii"))
+        pool.seed = seed
+        pool.source = fname
+        return pool
+
+
+################################################################
+#  Render
+#
+class CompileError(Exception):
+    """pdflatex failed on a rendered worksheet"""
+
+    def __init__(self, results):
+        """Constructor"""
+
+        self.results = results
+        self.log = "\n".join(r.log for r in results if not r.ok)
+        Exception.__init__(self, "pdflatex failed: %s" % ", ".join(
+                           os.path.basename(r.tex or r.pdf) for r in results if not r.ok))
+
+
+def Render(op, pages, seed=None, backend="latex", compile=True, files=None,
+           parts=("problems", "solutions"), **options):
+    """Make a worksheet without leaving anything in the file system.
+
+    Returns {part: document}, the PDFs as bytes, or the LaTeX sources
+    as str if compile is False.  Given files, a dict of part -> file
+    object (binary for PDFs, text for LaTeX), the documents are written
+    there instead and only those parts are made.  pdflatex runs in a
+    private temporary directory and CompileError is raised if it fails.
+    The other options are those of Worksheets.
+    """
+
+    if (files is not None):
+        parts = tuple(files)
+    ws = Worksheets(op, pages, "", seed=seed, backend=backend, compile=compile,
+                    parts=parts, **options)
+    latex = (backend == "latex") and (not compile)
+    sinks = files or {part: io.StringIO() if latex else io.BytesIO() for part in ws.parts}
+
+    if (backend == "pdf") or (latex):
+        ws.Write(sinks.get("problems"), sinks.get("solutions"))
+    else:
+        with tempfile.TemporaryDirectory(prefix="worksheets-") as tmp:
+            ws.output = os.path.join(tmp, op)
+            results = ws.Create()
+            if (not all(r.ok for r in results)):
+                raise CompileError(results)
+            for part in ws.parts:
+                with open(ws.output+"_%s.pdf" % part, "rb") as f:
+                    shutil.copyfileobj(f, sinks[part])
+
+    if (files is None):
+        return {part: f.getvalue() for part, f in sinks.items()}
+
+
+################################################################
+#  _BuildPage
+#
+#  the worksheets a worker process builds pages of, kept for the life
+#  of the process so that permutations are not redrawn per page, and
+#  the banks it has mapped, by file name
+_sheets = []
+_banks = {}
+
+def _InitWorker(sheets):
+    """Keep the worksheets this worker builds pages of"""
+
+    global _sheets
+    _sheets = sheets
+
+def _BuildPage(k, page, want=(True, True)):
+    """Build one page of worksheet k in a worker process"""
+
+    ws = _sheets[k]
+    return ws.BuildPage(ws.PageRng(page), page=page, want=want)
+
+
+################################################################
+#  ProblemType
+#
+class ProblemType:
+    """One kind of problem: how to make it and how to lay it out"""
+
+    def __init__(self, name, generator, solution, problem, rows=4, ruled=True,
+                 help="", args=(), stacks=None, space=None, unrank=None, per=1,
+                 record=None, table=None):
+        """Constructor
+
+        generator is a Worksheets method, called with a random.Random and
+        args, that returns a tuple of values.  solution and problem turn
+        those values into LaTeX, rows is the number of rows of four on a
+        page and ruled selects the table with rules between cells.
+        stacks, if given, lays the values out for the pdf backend.
+
+        space, if given, is the number of distinct items problems are made
+        of; unrank, called like generator with a list of per indices
+        into that space before the random.Random, returns the values.
+        record turns the values into a list of grading records for
+        export.  table, a function listing every distinct problem by its
+        index in the space, makes a Lookup the generators draw from and
+        the LaTeX comes from.
+        """
+
+        self.name = name
+        self.generator = generator
+        self.args = args
+        self.solution = solution
+        self.problem = problem
+        self.rows = rows
+        self.ruled = ruled
+        self.help = help
+        self.stacks = stacks
+        self.space = space
+        self.unrank = unrank
+        self.per = per
+        self.record = record
+        self.table = None
+        if (table is not None):
+            self.table = Lookup(table, problem, solution)
+            self.problem = self.table.Problem
+            self.solution = self.table.Solution
+
+    def __repr__(self):
+        return "ProblemType(%r)" % self.name
+
+
+def Template(fmt, *idx):
+    """A function formatting fmt with all the values, or those at idx"""
+
+    if (len(idx) == 0):
+        return fmt.__mod__
+    get = operator.itemgetter(*idx)
+    if (len(idx) == 1):
+        return lambda v: fmt % (get(v),)
+    return lambda v: fmt % get(v)
+
+
+################################################################
+#  Lookup
+#
+class Lookup:
+    """Every distinct problem of an op, with its LaTeX, made once.
+
+    values lists the problems by index; the problem and solution text
+    are found by value, so values from anywhere (a Pool, a bank) hit.
+    Nothing is made until the op is first used.
+    """
+
+    def __init__(self, table, problem, solution):
+        """Constructor"""
+
+        self.table = table
+        self.render = (problem, solution)
+        self.values = None
+        self.problems = self.solutions = None
+
+    def Build(self):
+        """Make the tables, the first time only"""
+
+        if (self.values is None):
+            problem, solution = self.render
+            values = self.table()
+            self.problems = {v: problem(v) for v in values}
+            self.solutions = {v: solution(v) for v in values}
+            self.values = values
+        return self
+
+    def Problem(self, v):
+        """LaTeX for the values v"""
+
+        if (self.values is None):
+            self.Build()
+        text = self.problems.get(v)
+        return self.render[0](v) if (text is None) else text
+
+    def Solution(self, v):
+        """LaTeX for the values v, worked"""
+
+        if (self.values is None):
+            self.Build()
+        text = self.solutions.get(v)
+        return self.render[1](v) if (text is None) else text
+
+
+#  (A, B, A*B) for every pair of digits 2-9, by index, and for md<d>
+#  the same with B = d
+MUL1_PAIRS = [(A, B, A*B) for A in range(2,10) for B in range(2,10)]
+MD_TRIPLES = {d: [(A, d, A*d) for A in range(2,10)] for d in range(2,10)}
+
+#  the LaTeX cell of each product, keyed by (A, B) and by (A, B, A*B)
+MUL1_CELLS = {}
+for A, B, C in MUL1_PAIRS:
+    MUL1_CELLS[A,B] = Worksheets.MUL1_ONE % (A, B)
+    MUL1_CELLS[A,B,C] = Worksheets.MUL1_ONE_SOL % (A, B, C)
+del A, B, C
+
+
+################################################################
+#  Native layouts
+#
+#  For the pdf backend a problem is a list of stacks.  A stack is a
+#  list of rows, each (sign, text) with the texts right aligned, or
+#  None for a rule.  A sign of None centers the text instead.
+#
+TIMES = "\u00d7"
+
+def Stacked(sign, operands, answer, partials=(), plus="+"):
+    """Operands over a rule, then any partial products and the answer"""
+
+    def stacks(v, solution):
+        rows = [("", v[i]) for i in operands[:-1]] + [(sign, v[operands[-1]]), None]
+        if (solution):
+            if (partials):
+                rows += [("", v[i]) for i in partials[:-1]]
+                rows += [(plus, v[partials[-1]]), None]
+            rows.append(("", v[answer]))
+        return [rows]
+    return stacks
+
+
+def Products(v, solution):
+    """Four small products, the values are (a, b, a*b) triples"""
+
+    return [[("", v[i]), (TIMES, v[i+1]), None] + ([("", v[i+2])] if solution else [])
+            for i in range(0, 12, 3)]
+
+
+def Decimals(text, f):
+    """f applied to the values with their fixed point numbers written out"""
+
+    return lambda v, *args: f(text(v), *args)
+
+
+def Sentence(solution, problem):
+    """One centered line of text, solution and problem map the values to it"""
+
+    return lambda v, sol: [[(None, solution(v) if sol else problem(v))]]
+
+
+def StackSize(rows, width, size=14, depth=None):
+    """The font size a stack fits width, and depth if given, at, its width
+    in characters and its height in points"""
+
+    texts = ["%s" % r[1] for r in rows if r is not None]
+    signs = [len(r[0]) for r in rows if (r is not None) and r[0]]
+    chars = max(len(t) for t in texts) + (max(signs)+1 if signs else 0)
+    lines = 1.25*len(texts) + 0.3*(len(rows) - len(texts))
+    size = min(size, 0.9*width / (pdf.COURIER*chars))
+    if (depth is not None):
+        size = min(size, depth / lines)
+    return size, chars, size*lines
+
+
+def DrawStack(rows, cx, y, width, size=14, depth=None):
+    """Content stream operators for a stack centered on cx, top at y, no
+    wider than width nor deeper than depth"""
+
+    size, chars, height = StackSize(rows, width, size, depth)
+    cw = pdf.COURIER*size
+    x0 = cx - chars*cw/2
+    x1 = x0 + chars*cw
+
+    out = []
+    y -= size
+    for r in rows:
+        if (r is None):
+            out.append(pdf.Line(x0, y + 0.8*size, x1, y + 0.8*size))
+            y -= 0.3*size
+            continue
+        sign, text = r[0], "%s" % r[1]
+        if (sign is None):
+            out.append(pdf.Text(cx - len(text)*cw/2, y, text, size))
+        else:
+            if (sign):
+                out.append(pdf.Text(x0, y, sign, size))
+            out.append(pdf.Text(x1 - len(text)*cw, y, text, size))
+        y -= 1.25*size
+    return "".join(out)
+
+
+################################################################
+#  Records
+#
+#  For export a problem becomes one or more dicts: operator, operands
+#  and answer, and steps for any intermediate results.
+#
+def Record(operator, operands, answer, **steps):
+    """A record function, the arguments are indices into the values.
+
+    Each step is an index or a tuple of them.
+    """
+
+    def record(v):
+        r = {"operator": operator, "operands": [v[i] for i in operands],
+             "answer": v[answer]}
+        if (steps):
+            r["steps"] = {k: [v[i] for i in idx] if isinstance(idx, tuple) else v[idx]
+                          for k, idx in steps.items()}
+        return [r]
+    return record
+
+
+def ProductRecords(v):
+    """Four products, the values are (a, b, a*b) triples"""
+
+    return [{"operator": "*", "operands": [v[i], v[i+1]], "answer": v[i+2]}
+            for i in range(0, 12, 3)]
+
+
+def PctRecord(operator, places):
+    """Percents, the values are (x, y, answer), the answer scaled by
+    10**places and written out exactly"""
+
+    return lambda v: [{"operator": operator, "operands": [v[0], v[1]],
+                       "answer": Fixed(v[2], places)}]
+
+
+def DivRecord(v):
+    """Long division, the values are (D, d, q, r)"""
+
+    L = LongDivision(v[0], v[1])
+    return [{"operator": "/", "operands": [L.dividend, L.divisor],
+             "answer": L.quotient,
+             "steps": {"remainder": L.remainder, "subtract": [list(t) for t in L.steps]}}]
+
+
+def FracRecord(v):
+    """Fractions, the values are (A, B, op, C, D, E, F)"""
+
+    A, B, op, C, D, E, F = v
+    return [{"operator": "+-*/"[op], "operands": ["%d/%d" % (A,B), "%d/%d" % (C,D)],
+             "answer": ("%d/%d" % (E,F)) if (F != 1) else ("%d" % E)}]
+
+
+def PowRecord(v):
+    """Powers, the values are (B, a, op, b, c)"""
+
+    B, a, op, b, c = v
+    return [{"operator": "*/"[op], "operands": ["%d^%d" % (B,a), "%d^%d" % (B,b)],
+             "answer": "%d^%d" % (B,c)}]
+
+
+################################################################
+#  Problem types
+#
+#  op -> ProblemType, in the order of the usage message
+PROBLEMS = {}
+
+def Register(kind):
+    """Make a problem type available as an op"""
+
+    PROBLEMS[kind.name] = kind
+    return kind
+
+
+W = Worksheets
+Register(ProblemType("add2", W.Add2, Template(W.ADD_SOL), Template(W.ADD_ANS, 0,1),
+                     help="two digit integer addition",
+                     stacks=Stacked("+", (0,1), 2),
+                     record=Record("+", (0,1), 2)))
+Register(ProblemType("add3", W.Add3, Template(W.ADD3_SOL), Template(W.ADD3_ANS, 0,1,2),
+                     help="three digit integer addition",
+                     stacks=Stacked("+", (0,1,2), 3),
+                     record=Record("+", (0,1,2), 3)))
+Register(ProblemType("add4", W.Add4, Template(W.ADD4_SOL), Template(W.ADD4_ANS, 0,1,2,3),
+                     help="four digit integer addition",
+                     stacks=Stacked("+", (0,1,2,3), 4),
+                     record=Record("+", (0,1,2,3), 4)))
+Register(ProblemType("addm", W.Addm, Template(W.ADD_SOL), Template(W.ADD_ANS, 0,1),
+                     help="mixed-sign addition",
+                     stacks=Stacked("+", (0,1), 2),
+                     record=Record("+", (0,1), 2)))
+Register(ProblemType("subm", W.Subm, Template(W.SUB_SOL), Template(W.SUB_ANS, 0,1),
+                     help="mixed-sign subtraction",
+                     stacks=Stacked("-", (0,1), 2),
+                     record=Record("-", (0,1), 2)))
+Register(ProblemType("sub", W.Sub, Template(W.SUB_SOL), Template(W.SUB_ANS, 0,1),
+                     help="multidigit integer subtraction with borrowing",
+                     stacks=Stacked("-", (0,1), 2),
+                     record=Record("-", (0,1), 2)))
+Register(ProblemType("subnb", W.SubNice, Template(W.SUB_SOL), Template(W.SUB_ANS, 0,1),
+                     help="multidigit integer subtraction without borrowing",
+                     stacks=Stacked("-", (0,1), 2),
+                     record=Record("-", (0,1), 2)))
+for k in range(5):
+    Register(ProblemType("add2c%d" % k, W.AddCarry, Template(W.ADD_SOL),
+                         Template(W.ADD_ANS, 0,1), args=(2,k),
+                         help="four-digit addition with %d carries" % k,
+                         stacks=Stacked("+", (0,1), 2),
+                         record=Record("+", (0,1), 2)))
+for k in range(5):
+    Register(ProblemType("add3c%d" % k, W.AddCarry, Template(W.ADD3_SOL),
+                         Template(W.ADD3_ANS, 0,1,2), args=(3,k),
+                         help="three four-digit numbers, %d carries" % k,
+                         stacks=Stacked("+", (0,1,2), 3),
+                         record=Record("+", (0,1,2), 3)))
+for k in range(5):
+    Register(ProblemType("add4c%d" % k, W.AddCarry, Template(W.ADD4_SOL),
+                         Template(W.ADD4_ANS, 0,1,2,3), args=(4,k),
+                         help="four four-digit numbers, %d carries" % k,
+                         stacks=Stacked("+", (0,1,2,3), 4),
+                         record=Record("+", (0,1,2,3), 4)))
+for k in range(4):
+    Register(ProblemType("subb%d" % k, W.SubBorrow, Template(W.SUB_SOL),
+                         Template(W.SUB_ANS, 0,1), args=(k,),
+                         help="four-digit subtraction with %d borrows" % k,
+                         stacks=Stacked("-", (0,1), 2),
+                         record=Record("-", (0,1), 2)))
+Register(ProblemType("mul1", W.Mul1, W.Mul1Solution, W.Mul1Problem, ruled=False,
+                     help="random single-digit multiplication", stacks=Products,
+                     space=64, unrank=W.Mul1Unrank, per=4,
+                     record=ProductRecords))
+Register(ProblemType("mul2", W.Mul2, Template(W.MUL2_SOL), Template(W.MUL2_ANS, 0,1),
+                     help="multiply two two-digit integers",
+                     stacks=Stacked(TIMES, (0,1), 4, (2,3)),
+                     record=Record("*", (0,1), 4, partials=(2,3))))
+Register(ProblemType("mul3", W.Mul3, Template(W.MUL3_SOL), Template(W.MUL3_ANS, 0,1),
+                     help="multiply two three-digit integers",
+                     stacks=Stacked(TIMES, (0,1), 5, (2,3,4)),
+                     record=Record("*", (0,1), 5, partials=(2,3,4))))
+Register(ProblemType("muls", W.Muls, Template(W.MULS_SOL), Template(W.MULS_ANS, 0,1),
+                     help="single-digit multiplication",
+                     stacks=Stacked(TIMES, (0,1), 2),
+                     record=Record("*", (0,1), 2)))
+Register(ProblemType("div1", W.Div1, W.DivSolution, Template(W.DIV_ANS, 1,0),
+                     help="single-digit long division", stacks=W.DivStacks,
+                     record=DivRecord))
+Register(ProblemType("divm", W.Divm, W.DivSolution, Template(W.DIV_ANS, 1,0),
+                     help="multi-digit long division", stacks=W.DivStacks,
+                     record=DivRecord))
+for d in range(2,10):
+    Register(ProblemType("md%d" % d, W.Md, W.Mul1Solution, W.Mul1Problem, ruled=False,
+                         help="multiplication practice for digit %d" % d, args=(d,),
+                         stacks=Products, space=8, unrank=W.MdUnrank, per=4,
+                         record=ProductRecords))
+Register(ProblemType("frac1", W.Frac1, W.Frac1Solution, W.Frac1Problem,
+                     rows=10, help="arithmetic with one-digit fractions",
+                     space=72*56*4, unrank=W.Frac1Unrank, table=W.Frac1Table,
+                     record=FracRecord))
+Register(ProblemType("pow", W.Pow, W.PowSolution, W.PowProblem, rows=10,
+                     help="multiplication and division with powers",
+                     space=8*8*8*2, unrank=W.PowUnrank, table=W.PowTable,
+                     record=PowRecord))
+Register(ProblemType("dmult", W.Dmult, W.DmultSolution, W.DmultProblem,
+                     help="multiplication of decimal numbers",
+                     stacks=Decimals(W.DmultText, Stacked(TIMES, (0,1), 4, (2,3), "")),
+                     record=Decimals(W.DmultText, Record("*", (0,1), 4, partials=(2,3)))))
+Register(ProblemType("pct1", W.Pct1, W.Pct1Solution, Template(W.PCT1_ANS, 0,1),
+                     rows=20, help="percent of a number",
+                     stacks=Sentence(functools.partial(W.Pct1Solution, fmt=W.PCT1_LINE),
+                                     Template("%d%% of %d", 0,1)),
+                     record=PctRecord("% of", 2)))
+Register(ProblemType("pct2", W.Pct2, W.Pct2Solution, Template(W.PCT2_ANS, 0,1),
+                     rows=20, help="percent change",
+                     stacks=Sentence(functools.partial(W.Pct2Solution, fmt=W.PCT2_LINE),
+                                     Template("from %d to %d", 0,1)),
+                     record=PctRecord("% change", 3)))
+del W
 
 
 ################################################################
@@ -821,44 +2952,131 @@ def main():
 
     if (len(sys.argv) == 1):
         print()
-        print("worksheets <op> <pages> <output>")
+        print("worksheets <op> <pages> <output> [--timeout <s>] [--fmt]")
+        print("           [--cache] [--cache-size <MB>] [--cache-stats]")
+        print("           [--seed <n>] [--jobs <n>] [--batched] [--tex-only]")
+        print("           [--backend latex|pdf] [--single] [--repeats]")
+        print("           [--profile] [--trace <file>] [--export jsonl|csv]")
+        print("           [--only problems|solutions] [--bank <file>]")
+        print("           [--students <n>|<roster>] [--split-students] [--fit]")
         print()
         print("  <op>      - the operation (see below)")
         print("  <pages>   - number of pages")
         print("  <output>  - output base name")
         print()
         print("  <op> is one of")
-        print("    add2    - two digit integer addition")
-        print("    add3    - three digit integer addition")
-        print("    add4    - four digit integer addition")
-        print("    addm    - mixed-sign addition")
-        print("    subm    - mixed-sign addition")
-        print("    sub     - multidigit integer subtraction with borrowing")
-        print("    subnb   - multidigit integer subtraction without borrowing")
-        print("    mul1    - random single-digit multiplication") 
-        print("    mul2    - multiply two two-digit integers")
-        print("    mul3    - multiply two three-digit integers")
-        print("    muls    - single-digit multiplication")
-        print("    div1    - single-digit long division")
-        print("    divm    - multi-digit long division")
-        print("    md?     - multiplication practice for digit ?")
-        print("    reduce  - fractions to reduce to lowest terms")
-        print("    frac1   - arithmetic with one-digit fractions")
-        print("    pow     - multiplication and division with powers")
-        print("    dmult   - multiplication of decimal numbers")
-        print("    pct1    - percent of a number")
-        print("    pct2    - percent change")
+        for kind in PROBLEMS.values():
+            print("    %-7s - %s" % (kind.name, kind.help))
         print()
         return
 
-    op = sys.argv[1]
-    pages = int(sys.argv[2])
-    output = sys.argv[3]
-
-    #  set the seed from /dev/urandom
-    random.seed(int(binascii.hexlify(os.urandom(4)),16))
+    parser = argparse.ArgumentParser(prog="worksheets")
+    parser.add_argument("op", choices=list(PROBLEMS), metavar="op")
+    parser.add_argument("pages", type=int)
+    parser.add_argument("output")
+    parser.add_argument("--timeout", type=float, default=COMPILE_TIMEOUT,
+                        help="seconds allowed per pdflatex run")
+    parser.add_argument("--fmt", action="store_true",
+                        help="use a cached precompiled preamble")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse PDFs built from identical sources")
+    parser.add_argument("--cache-size", type=float, default=CACHE_SIZE/2**20,
+                        help="PDF cache limit, MB")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="report on the PDF cache when done")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed (default: from /dev/urandom)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="processes used to generate pages")
+    parser.add_argument("--batched", action="store_true",
+                        help="draw all operands at once (see README for the ops)")
+    parser.add_argument("--tex-only", action="store_true",
+                        help="write the .tex files but do not run pdflatex")
+    parser.add_argument("--backend", choices=["latex", "pdf"], default="latex",
+                        help="pdf draws simple layouts directly, without TeX")
+    parser.add_argument("--single", action="store_true",
+                        help="compile problems and solutions as one document, then split it")
+    parser.add_argument("--repeats", action="store_true",
+                        help="draw each problem independently, repeats allowed")
+    parser.add_argument("--profile", action="store_true",
+                        help="print where the time went when done")
+    parser.add_argument("--trace",
+                        help="write the profile here as a JSON (Chrome) trace")
+    parser.add_argument("--only", choices=["problems", "solutions"],
+                        help="make just one of the two documents")
+    parser.add_argument("--bank",
+                        help="draw the problems from a bank made by bank.py")
+    parser.add_argument("--students",
+                        help="a class set: a count, or a file of names one per line, "
+                        "each student getting their own variant")
+    parser.add_argument("--split-students", action="store_true",
+                        help="also write each student's pages to files of their own")
+    parser.add_argument("--fit", action="store_true",
+                        help="as many rows on a page as the problems' heights "
+                        "allow, spaced evenly")
+    parser.add_argument("--export", choices=["jsonl", "csv"],
+                        help="write the problems as records to <output>.jsonl or "
+                        ".csv (- for stdout) instead of worksheets")
+    args = parser.parse_args()
+
+    students = None
+    if (args.students is not None) and (args.students.isdigit()):
+        students = int(args.students)
+    elif (args.students is not None):
+        with open(args.students) as f:
+            students = [line.strip() for line in f
+                        if line.strip() and not line.startswith("#")]
+    if (args.split_students) and (students is None):
+        parser.error("--split-students needs --students")
+
+    if (args.export):
+        ws = Worksheets(args.op, args.pages, args.output, seed=args.seed,
+                        batched=args.batched, distinct=not args.repeats,
+                        bank=args.bank, students=students, fit=args.fit)
+        if (args.output == "-"):
+            try:
+                ws.Export(sys.stdout, args.export)
+                sys.stdout.flush()
+            except BrokenPipeError:
+                #  the reader went away (| head), so stop, and keep the
+                #  flush at exit from failing again
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+                sys.exit(1)
+        else:
+            with open("%s.%s" % (args.output, args.export), "w", newline="") as f:
+                ws.Export(f, args.export)
+        return
 
-    Worksheets(op, pages, output).Create()
+    cache = None
+    if (args.cache or args.cache_stats):
+        cache = PdfCache(int(args.cache_size*2**20))
+    profile = Profile() if (args.profile or args.trace) else None
+
+    results = Worksheets(args.op, args.pages, args.output, args.timeout,
+                         args.fmt, cache if args.cache else None,
+                         seed=args.seed, jobs=args.jobs,
+                         batched=args.batched, compile=not args.tex_only,
+                         backend=args.backend, single=args.single,
+                         distinct=not args.repeats, profile=profile,
+                         parts=[args.only] if args.only else ["problems", "solutions"],
+                         bank=args.bank, students=students,
+                         split=args.split_students, fit=args.fit).Create()
+    if (args.cache_stats):
+        cache.Report()
+    if (args.profile):
+        profile.Summary()
+    if (args.trace):
+        with open(args.trace, "w") as f:
+            json.dump(profile.Trace(), f)
+    failed = False
+    for r in results:
+        if (not r.ok):
+            failed = True
+            why = "timed out" if r.timedout else "failed"
+            print("%s: pdflatex %s after %0.1f s" % (r.tex, why, r.elapsed), file=sys.stderr)
+            print("\n".join(r.log.splitlines()[-20:]), file=sys.stderr)
+    if (failed):
+        sys.exit(1)
 
 
 if (__name__ == "__main__"):